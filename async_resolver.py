@@ -0,0 +1,38 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Fan out fetch(username) calls with at most `concurrency` in flight at once
+async def _resolve_all(usernames, fetch, concurrency):
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = []
+
+    async def resolve(username):
+        async with semaphore:
+            return await loop.run_in_executor(executor, fetch, username)
+
+    def start(username):
+        tasks.append(loop.create_task(resolve(username)))
+
+    # A separate single-thread source drains the input, so a paginated generator fetches its
+    # next page while lookups for the usernames already received are in flight
+    def produce():
+        for username in usernames:
+            loop.call_soon_threadsafe(start, username)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, ThreadPoolExecutor(max_workers=1) as source:
+        await loop.run_in_executor(source, produce)
+        # gather keeps the results in the same order as the input usernames
+        return await asyncio.gather(*tasks)
+
+# Resolve every username with fetch(username) concurrently and return the results in input order
+def resolve_concurrently(usernames, fetch, concurrency):
+    return asyncio.run(_resolve_all(usernames, fetch, max(1, concurrency)))
+
+# Read the resolver concurrency from the environment value (1 keeps the serial loop)
+def parse_concurrency(value, default=1):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
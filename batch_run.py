@@ -0,0 +1,121 @@
+import csv
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+import pandas as pd
+
+import mann_lates
+from emu_directory import load_emu_sources
+from fuzzy_match import open_fuzzy_matcher
+from row_log import open_row_log
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Manifest CSV with one job per row: org-name,emu-users-file,user-mappings-file
+BATCH_MANIFEST = os.getenv("BATCH_MANIFEST")
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS") or os.cpu_count() or 1)
+EMU_CACHE_DIR = os.getenv("EMU_CACHE_DIR")
+REQUIRED_COLUMNS = {'login', 'name', 'saml_name_id'}
+
+# Parsed EMU frames shared by every job in a worker, keyed by workbook path
+_emu_frames = {}
+
+
+# Function to read the batch manifest
+def read_manifest(file_path):
+    with open(file_path, mode='r', newline='', encoding='utf-8') as file:
+        jobs = [row for row in csv.DictReader(file) if row.get("org-name")]
+    for job in jobs:
+        for column in ("emu-users-file", "user-mappings-file"):
+            if not job.get(column):
+                raise ValueError(f"Manifest row for {job['org-name']} is missing '{column}'")
+    return jobs
+
+# Parse each distinct workbook once, no matter how many orgs share it
+def load_emu_frames(jobs):
+    frames = {}
+    for workbook in dict.fromkeys(job["emu-users-file"] for job in jobs):
+        logging.info(f"Loading EMU workbook: {workbook}")
+        frame = pd.DataFrame(load_emu_sources(workbook, EMU_CACHE_DIR))
+        if not REQUIRED_COLUMNS.issubset(frame.columns):
+            raise ValueError(f"Excel file {workbook} must contain the following columns: {REQUIRED_COLUMNS}")
+        frames[workbook] = frame
+    return frames
+
+def _init_worker(emu_frames):
+    _emu_frames.update(emu_frames)
+
+# Run one org's mapping job in a worker process, logging its per-row output to <mappings>.log
+def run_job(job):
+    org_suffix = job["org-name"].split('-')[0]
+    mappings_file = job["user-mappings-file"]
+    emu_users_df = _emu_frames[job["emu-users-file"]]
+
+    started = time.perf_counter()
+    with open(f"{mappings_file}.log", mode='w', encoding='utf-8') as log_file, redirect_stdout(log_file):
+        row_log = open_row_log(mappings_file, mann_lates.QUIET_MODE, printer=print)
+        fuzzy = None
+        if mann_lates.FUZZY_MATCH:
+            fuzzy = open_fuzzy_matcher(emu_users_df[["login", "name", "saml_name_id"]].to_dict("records"), mappings_file, require_email=True)
+        try:
+            if mann_lates.MAPPING_MODE == "join":
+                mann_lates.process_user_mappings_join(mappings_file, emu_users_df, org_suffix, row_log=row_log, fuzzy=fuzzy)
+            else:
+                mann_lates.process_user_mappings(mappings_file, emu_users_df, org_suffix, row_log=row_log, fuzzy=fuzzy)
+        finally:
+            row_log.close()
+            if fuzzy is not None:
+                fuzzy.close()
+    elapsed = time.perf_counter() - started
+
+    total = resolved = 0
+    with open(mappings_file, mode='r', newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            total += 1
+            resolved += bool(row.get("target-user"))
+    return {"org": job["org-name"], "rows": total, "resolved": resolved, "unresolved": total - resolved, "seconds": elapsed}
+
+# Run every manifest job on a process pool and print a combined summary
+def run_batch(manifest_file, workers=BATCH_WORKERS):
+    jobs = read_manifest(manifest_file)
+    logging.info(f"Running {len(jobs)} jobs from {manifest_file} on {workers} workers")
+    emu_frames = load_emu_frames(jobs)
+
+    results, failures = [], []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(emu_frames,)) as executor:
+        futures = {executor.submit(run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logging.error(f"Job for {job['org-name']} failed: {str(e)}")
+                failures.append(job["org-name"])
+                continue
+            logging.info(f"Finished {result['org']}: {result['resolved']}/{result['rows']} resolved in {result['seconds']:.1f}s")
+            results.append(result)
+
+    print(f"{'org':<30} {'rows':>8} {'resolved':>9} {'unresolved':>11} {'seconds':>8}")
+    for result in sorted(results, key=lambda result: result["org"]):
+        print(f"{result['org']:<30} {result['rows']:>8} {result['resolved']:>9} {result['unresolved']:>11} {result['seconds']:>8.1f}")
+    print(f"{'TOTAL':<30} {sum(r['rows'] for r in results):>8} {sum(r['resolved'] for r in results):>9} "
+          f"{sum(r['unresolved'] for r in results):>11}")
+    if failures:
+        print(f"Failed jobs: {', '.join(sorted(failures))}")
+    return results, failures
+
+def main():
+    manifest_file = sys.argv[1] if len(sys.argv) > 1 else BATCH_MANIFEST
+    if not manifest_file:
+        logging.error("Pass a manifest path or set BATCH_MANIFEST.")
+        sys.exit(1)
+    _, failures = run_batch(manifest_file)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
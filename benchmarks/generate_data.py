@@ -0,0 +1,59 @@
+import csv
+import os
+import random
+import sys
+
+from openpyxl import Workbook
+
+EXTRA_COLUMNS = [f"attribute_{index}" for index in range(12)]  # Stand-ins for the unused export columns
+
+
+# Deterministic identities shared by the data generator and the stub API server
+def login_for(index):
+    return f"user{index}"
+
+def email_for(login):
+    return f"{login}@example.com"
+
+# Write an EMU export with `rows` users, streamed through openpyxl's write-only mode
+def generate_emu_workbook(file_path, rows):
+    wb = Workbook(write_only=True)
+    sheet = wb.create_sheet("users")
+    sheet.append(["login", "name", "saml_name_id", *EXTRA_COLUMNS])
+    for index in range(rows):
+        login = login_for(index)
+        sheet.append([login, f"User {index}", email_for(login), *(f"{column}-{index}" for column in EXTRA_COLUMNS)])
+    wb.save(file_path)
+
+# Write a user-mappings CSV where roughly `match_ratio` of the mannequins exist in the EMU export
+def generate_mappings_csv(file_path, rows, emu_rows, match_ratio=0.9, seed=7):
+    rng = random.Random(seed)
+    with open(file_path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(["mannequin-user", "mannequin-id", "target-user"])
+        for index in range(rows):
+            if rng.random() < match_ratio:
+                mannequin_user = login_for(rng.randrange(emu_rows))
+            else:
+                mannequin_user = f"ghost{index}"  # Unknown to the EMU export and the stub API
+            writer.writerow([mannequin_user, f"M_{index}", ""])
+
+# Generate one EMU workbook and one mappings CSV per size into `directory`
+def generate(directory, sizes):
+    os.makedirs(directory, exist_ok=True)
+    for size in sizes:
+        emu_path = os.path.join(directory, f"emu-{size}.xlsx")
+        mappings_path = os.path.join(directory, f"mappings-{size}.csv")
+        if not os.path.exists(emu_path):
+            print(f"Generating {emu_path}")
+            generate_emu_workbook(emu_path, size)
+        if not os.path.exists(mappings_path):
+            print(f"Generating {mappings_path}")
+            generate_mappings_csv(mappings_path, size, size)
+
+def parse_sizes(value):
+    return [int(size.replace("k", "000").replace("M", "000000")) for size in value.split(",") if size]
+
+if __name__ == "__main__":
+    # Usage: python benchmarks/generate_data.py [directory] [sizes, e.g. 1k,10k,100k,1M]
+    generate(sys.argv[1] if len(sys.argv) > 1 else "bench-data", parse_sizes(sys.argv[2] if len(sys.argv) > 2 else "1k,10k,100k"))
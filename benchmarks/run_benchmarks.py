@@ -0,0 +1,162 @@
+import csv
+import importlib.util
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from generate_data import generate, parse_sizes
+from stub_server import StubGitHub
+
+STAGES = ("login-join", "login-loop", "email", "members", "reclaim")
+# The per-row login loop is O(mappings x users); raise BENCH_LOOP_MAX_ROWS to time it on larger sizes
+LOOP_MAX_ROWS = int(os.getenv("BENCH_LOOP_MAX_ROWS", "10000"))
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _load_script(name, file_name):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_DIR, file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Runs in a fresh process so imports read the benchmark environment and peak RSS is per stage
+def _run_stage(stage, emu_path, mappings_path, env, results):
+    os.environ.update(env)
+    sys.path.insert(0, REPO_DIR)
+    # Per-row console output is still formatted and written, just not to the terminal
+    sys.stdout = open(os.devnull, mode='w')
+    try:
+        results.put(_time_stage(stage, emu_path, mappings_path, env))
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+def _time_stage(stage, emu_path, mappings_path, env):
+    timings = {}
+
+    started = time.perf_counter()
+    if stage in ("login-join", "login-loop"):
+        script = _load_script("mann_lates", "mann_lates.py")
+        emu_users_df = script.read_excel_file(emu_path)
+        timings["load_s"] = time.perf_counter() - started
+        started = time.perf_counter()
+        if stage == "login-join":
+            script.process_user_mappings_join(mappings_path, emu_users_df, "bench")
+        else:
+            script.process_user_mappings(mappings_path, emu_users_df, "bench")
+    elif stage == "email":
+        script = _load_script("mannequintest", "mannequintest.py")
+        emu_users = script.read_emu_excel(emu_path)
+        timings["load_s"] = time.perf_counter() - started
+        started = time.perf_counter()
+        script.process_mannequins(mappings_path, emu_users)
+    elif stage == "reclaim":
+        script = _load_script("reclaim", "reclaim.py")
+        # Resolve every mannequin to the user of the same login; ghost logins fail the target lookup
+        with open(mappings_path, mode='r', newline='', encoding='utf-8') as file:
+            rows = [{**row, "target-user": row["mannequin-user"]} for row in csv.DictReader(file)]
+        with open(mappings_path, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=["mannequin-user", "mannequin-id", "target-user"])
+            writer.writeheader()
+            writer.writerows(rows)
+        timings["load_s"] = time.perf_counter() - started
+        started = time.perf_counter()
+        results = script.ReclaimResults(f"{mappings_path}.reclaim.csv")
+        row_log = script.open_row_log(mappings_path)
+        try:
+            script.reclaim_mannequins(mappings_path, "bench-org", env["GITHUB_TOKEN"], results, row_log, script.RECLAIM_CONCURRENCY)
+        finally:
+            row_log.close()
+            results.close()
+    else:
+        script = _load_script("target_user", "target-user.py")
+        timings["load_s"] = 0.0
+        script.process_csv_and_update(
+            mappings_path, "bench-org", env["GITHUB_TOKEN"],
+            int(os.getenv("RESOLVE_CONCURRENCY", "1")), os.getenv("EMAIL_RESOLVER", "rest"),
+        )
+    timings["process_s"] = time.perf_counter() - started
+    timings["peak_rss_mb"] = _peak_rss_mb()
+    return timings
+
+# Run one stage against one data size and return its timings
+def run_stage(stage, size, data_dir, stub_url, extra_env=None):
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        mappings_path = os.path.join(work_dir, "mappings.csv")
+        shutil.copy(os.path.join(data_dir, f"mappings-{size}.csv"), mappings_path)
+        env = {
+            "GITHUB_API_URL": stub_url,
+            "GITHUB_TOKEN": "bench-token",
+            "ORG_NAME": "bench-org",
+            "GHEC_CSV": mappings_path,
+            "EMU_EXCEL": os.path.join(data_dir, f"emu-{size}.xlsx"),
+            **(extra_env or {}),
+        }
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        process = context.Process(target=_run_stage, args=(stage, env["EMU_EXCEL"], mappings_path, env, results))
+        started = time.perf_counter()
+        process.start()
+        timings = results.get()
+        process.join()
+        if "error" in timings:
+            raise RuntimeError(f"{stage} at {size} rows failed: {timings['error']}")
+        timings["wall_s"] = time.perf_counter() - started
+        return timings
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run(sizes, stages, data_dir, latency=0.0, rate_limit=1_000_000, extra_env=None):
+    generate(data_dir, sizes)
+    report = []
+    for size in sizes:
+        stub = StubGitHub(members=size, latency=latency, rate_limit=rate_limit)
+        stub_url = stub.start()
+        try:
+            for stage in stages:
+                if stage == "login-loop" and size > LOOP_MAX_ROWS:
+                    print(f"Skipping login-loop at {size} rows (over {LOOP_MAX_ROWS})")
+                    continue
+                requests_before = stub.requests
+                timings = run_stage(stage, size, data_dir, stub_url, extra_env)
+                entry = {"stage": stage, "rows": size, "api_requests": stub.requests - requests_before, **timings}
+                report.append(entry)
+                print(f"{stage:<12} {size:>9} rows  load {entry['load_s']:8.2f}s  process {entry['process_s']:8.2f}s  "
+                      f"peak {entry['peak_rss_mb']:8.1f} MiB  api {entry['api_requests']:>8}")
+        finally:
+            stub.stop()
+    return report
+
+def main():
+    # Usage: python benchmarks/run_benchmarks.py [sizes] [stages] [report.json]
+    # Environment: BENCH_DATA_DIR, BENCH_LATENCY (seconds per API call), BENCH_RATE_LIMIT.
+    # Any other variable the scripts read (RESOLVE_CONCURRENCY, EMAIL_RESOLVER, CSV_STREAMING, ...) passes through.
+    sizes = parse_sizes(sys.argv[1] if len(sys.argv) > 1 else "1k,10k")
+    stages = (sys.argv[2].split(",") if len(sys.argv) > 2 else list(STAGES))
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        sys.exit(f"Unknown stages: {', '.join(sorted(unknown))}; choose from {', '.join(STAGES)}")
+    report = run(
+        sizes, stages, os.getenv("BENCH_DATA_DIR", os.path.join(REPO_DIR, "bench-data")),
+        latency=float(os.getenv("BENCH_LATENCY", "0")),
+        rate_limit=int(os.getenv("BENCH_RATE_LIMIT", "1000000")),
+    )
+    if len(sys.argv) > 3:
+        with open(sys.argv[3], mode='w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
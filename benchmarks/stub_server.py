@@ -0,0 +1,241 @@
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from generate_data import email_for, login_for
+
+
+# Local stand-in for the GitHub endpoints the scripts call: org members, user profiles, batched
+# GraphQL user lookups, SAML identity pages and the mannequin listing and reclaim mutations. Latency, page size and the
+# rate-limit budget are configurable. The org has one mannequin "M_<n>" per member. Status codes queued in
+# `faults` answer the next requests instead (429 and 403 as rate-limit responses with Retry-After: 0).
+class StubGitHub:
+    def __init__(self, members=1000, latency=0.0, rate_limit=5000, window=3600, max_per_page=100, port=0):
+        self.members = members
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.window = window
+        self.max_per_page = max_per_page
+        self._lock = threading.Lock()
+        self._window_start = {}  # Per rate-limit resource ("core" for REST, "graphql"), so their resets differ
+        self._used = {}  # Budget spent per (Authorization token, resource), so token pools can be exercised
+        self.revoked = set()  # Tokens answered with 401
+        self.faults = []  # Status codes returned to the next requests, oldest first
+        self.requests = 0
+        self.claims = {}  # mannequin id -> claimant login
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # Spend one unit of the token's budget; returns the rate-limit headers and whether the request is allowed
+    def _consume(self, cost=1, token=None, resource="core"):
+        with self._lock:
+            self.requests += 1
+            now = time.time()
+            window_start = self._window_start.get(resource)
+            if window_start is None or now - window_start >= self.window:
+                window_start = self._window_start[resource] = now
+                self._used = {key: used for key, used in self._used.items() if key[1] != resource}
+            used = self._used.get((token, resource), 0)
+            allowed = used + cost <= self.rate_limit
+            if allowed:
+                used = self._used[(token, resource)] = used + cost
+            headers = {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(self.rate_limit - used),
+                "X-RateLimit-Reset": str(int(window_start + self.window)),
+                "X-RateLimit-Resource": resource,
+            }
+            return headers, allowed
+
+    # Next queued fault as (status, body, headers), or None
+    def _fault(self):
+        with self._lock:
+            if not self.faults:
+                return None
+            self.requests += 1
+            status = self.faults.pop(0)
+        if status in (403, 429):
+            return status, {"message": "You have exceeded a secondary rate limit."}, {"Retry-After": "0"}
+        return status, {"message": "Server Error"}, {}
+
+    def _profile(self, login):
+        match = re.fullmatch(r"user(\d+)", login)
+        if not match:
+            return None
+        return {"login": login, "id": int(match.group(1)), "email": email_for(login)}
+
+    # One page of the org's mannequins with their claimants, cursor = offset
+    def _mannequins(self, after, per_page=100):
+        start = int(after or 0)
+        end = min(start + per_page, self.members)
+        with self._lock:
+            nodes = [
+                {"id": f"M_{index}", "login": f"mona{index}",
+                 "claimant": {"login": self.claims[f"M_{index}"]} if f"M_{index}" in self.claims else None}
+                for index in range(start, end)
+            ]
+        page_info = {"endCursor": str(end), "hasNextPage": end < self.members}
+        return {"data": {"organization": {"mannequins": {"pageInfo": page_info, "nodes": nodes}}}}
+
+    # One page of the org's SAML identities; every member is linked to its generated email
+    def _external_identities(self, after, per_page=100):
+        start = int(after or 0)
+        end = min(start + per_page, self.members)
+        nodes = [
+            {"samlIdentity": {"nameId": email_for(login_for(index))}, "scimIdentity": None, "user": {"login": login_for(index)}}
+            for index in range(start, end)
+        ]
+        page_info = {"endCursor": str(end), "hasNextPage": end < self.members}
+        return {"data": {"organization": {"samlIdentityProvider": {"externalIdentities": {"pageInfo": page_info, "nodes": nodes}}}}}
+
+    # Handle createAttributionInvitation / reattributeMannequinToUser by recording the claim
+    def _reclaim(self, query, variables):
+        field = "reattributeMannequinToUser" if "reattributeMannequinToUser" in query else "createAttributionInvitation"
+        source, target = variables.get("sourceId", ""), variables.get("targetId", "")
+        source_match, target_match = re.fullmatch(r"M_(\d+)", source), re.fullmatch(r"U_(\d+)", target)
+        if not source_match or int(source_match.group(1)) >= self.members:
+            return {"data": {field: None}, "errors": [{"type": "NOT_FOUND", "message": f"Could not resolve to a node with the global id of '{source}'"}]}
+        if not target_match:
+            return {"data": {field: None}, "errors": [{"type": "NOT_FOUND", "message": f"Could not resolve to a node with the global id of '{target}'"}]}
+        login = login_for(int(target_match.group(1)))
+        with self._lock:
+            self.claims[source] = login
+        return {"data": {field: {"source": {"id": source, "login": f"mona{source_match.group(1)}"}, "target": {"id": target, "login": login}}}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # Headers and body go out as separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=None, headers=None):
+                payload = json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _token(self):
+                return (self.headers.get("Authorization") or "").split(" ")[-1]
+
+            def do_GET(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                parsed = urlparse(self.path)
+                etag_match = self.headers.get("If-None-Match")
+                fault = stub._fault()
+                if fault is not None:
+                    return self._send(*fault)
+                if self._token() in stub.revoked:
+                    return self._send(401, {"message": "Bad credentials"})
+                headers, allowed = stub._consume(0 if etag_match else 1, self._token())
+                if not allowed:
+                    return self._send(403, {"message": "API rate limit exceeded"}, headers)
+
+                members_match = re.fullmatch(r"/orgs/([^/]+)/members", parsed.path)
+                users_match = re.fullmatch(r"/users/([^/]+)", parsed.path)
+                if members_match:
+                    query = parse_qs(parsed.query)
+                    per_page = min(int(query.get("per_page", ["30"])[0]), stub.max_per_page)
+                    page = int(query.get("page", ["1"])[0])
+                    start = (page - 1) * per_page
+                    end = min(start + per_page, stub.members)
+                    body = [{"login": login_for(index), "id": index} for index in range(start, end)]
+                    if end < stub.members:
+                        next_url = f"{stub.url}{parsed.path}?per_page={per_page}&page={page + 1}"
+                        headers["Link"] = f'<{next_url}>; rel="next"'
+                elif users_match:
+                    body = stub._profile(users_match.group(1))
+                    if body is None:
+                        return self._send(404, {"message": "Not Found"}, headers)
+                else:
+                    return self._send(404, {"message": "Not Found"}, headers)
+
+                etag = '"' + hashlib.md5(json.dumps(body).encode()).hexdigest() + '"'
+                headers["ETag"] = etag
+                if etag_match == etag:
+                    return self._send(304, None, headers)
+                if etag_match:
+                    stub._consume(1, self._token())  # A changed resource costs a full request after all
+                self._send(200, body, headers)
+
+            def do_POST(self):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                fault = stub._fault()
+                if fault is not None or self._token() in stub.revoked:
+                    self.rfile.read(int(self.headers.get("Content-Length", 0)))  # Keep the connection reusable
+                    return self._send(*fault) if fault is not None else self._send(401, {"message": "Bad credentials"})
+                headers, allowed = stub._consume(1, self._token(), "graphql")
+                if not allowed:
+                    return self._send(403, {"message": "API rate limit exceeded"}, headers)
+                if urlparse(self.path).path != "/graphql":
+                    return self._send(404, {"message": "Not Found"}, headers)
+
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                query = request.get("query") or ""
+                variables = request.get("variables") or {}
+                if query.lstrip().startswith("mutation"):
+                    return self._send(200, stub._reclaim(query, variables), headers)
+                if "externalIdentities(" in query:
+                    return self._send(200, stub._external_identities(variables.get("after")), headers)
+                if "mannequins(" in query:
+                    return self._send(200, stub._mannequins(variables.get("after")), headers)
+                if "organization(" in query:
+                    return self._send(200, {"data": {"organization": {"id": "O_1"}}}, headers)
+
+                data, errors = {}, []
+                for name, login in variables.items():
+                    match = re.fullmatch(r"login(\d+)", name)
+                    if not match:
+                        continue
+                    profile = stub._profile(login)
+                    data[f"u{match.group(1)}"] = profile and {**profile, "id": f"U_{profile['id']}"}
+                    if profile is None:
+                        errors.append({"type": "NOT_FOUND", "path": [f"u{match.group(1)}"],
+                                       "message": f"Could not resolve to a User with the login of '{login}'."})
+                body = {"data": data}
+                if errors:
+                    body["errors"] = errors
+                self._send(200, body, headers)
+
+        return Handler
+
+if __name__ == "__main__":
+    # Usage: python benchmarks/stub_server.py [members] [latency seconds] [port]
+    stub = StubGitHub(
+        members=int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        latency=float(sys.argv[2]) if len(sys.argv) > 2 else 0.0,
+        port=int(sys.argv[3]) if len(sys.argv) > 3 else 8765,
+    )
+    print(f"Stub GitHub API listening on {stub.start()}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
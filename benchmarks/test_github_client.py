@@ -0,0 +1,113 @@
+import os
+import sys
+import time
+
+import pytest
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import github_client
+from github_client import Credential, GitHubClient, TokenPool
+from run_metrics import METRICS
+from stub_server import StubGitHub
+
+
+# GitHubClient against the local stub: retries, rate-limit pacing, timeouts and the token pool
+
+
+@pytest.fixture
+def stub():
+    server = StubGitHub(members=10)
+    server.start()
+    yield server
+    server.stop()
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(github_client, "BACKOFF_BASE", 0.01)
+    METRICS.counters.clear()
+
+
+@pytest.mark.parametrize("status", [429, 403, 502])
+def test_retries_rate_limits_and_server_errors(stub, status):
+    stub.faults = [status, status]
+    response = GitHubClient("t1").get(f"{stub.url}/users/user1")
+    assert response.status_code == 200
+    assert response.json()["login"] == "user1"
+    assert stub.requests == 3
+    assert METRICS.counters["api_retries"] == 2
+
+def test_gives_up_after_max_retries(stub):
+    stub.faults = [429] * 5
+    response = GitHubClient("t1", max_retries=2).get(f"{stub.url}/users/user1")
+    assert response.status_code == 429
+    assert stub.requests == 3
+
+def test_timeout_is_retried_then_raised(stub):
+    stub.latency = 0.5
+    client = GitHubClient("t1", max_retries=1, timeout=0.1)
+    with pytest.raises(requests.Timeout):
+        client.get(f"{stub.url}/users/user1")
+    assert METRICS.counters["api_retries"] == 1
+
+def test_paces_until_the_window_resets(stub):
+    stub.rate_limit, stub.window = 15, 2
+    client = GitHubClient("t1")
+    started = time.time()
+    statuses = [client.get(f"{stub.url}/users/user1").status_code for _ in range(8)]
+    assert statuses == [200] * 8
+    # Five requests spend the budget down to the reserve; the sixth waits for the next window
+    assert METRICS.counters["rate_limit_wait_seconds"] > 0
+    assert time.time() - started >= 1
+
+def test_revoked_token_is_removed_from_the_pool(stub):
+    stub.revoked = {"bad"}
+    good, bad = Credential("good"), Credential("bad")
+    client = GitHubClient(tokens=TokenPool([bad, good]))
+    statuses = [client.get(f"{stub.url}/users/user1").status_code for _ in range(4)]
+    assert statuses == [200] * 4
+    assert client.tokens.credentials == [good]
+    assert METRICS.counters["credentials_removed"] == 1
+
+def test_last_credential_is_kept(stub):
+    stub.revoked = {"bad"}
+    client = GitHubClient(tokens=TokenPool([Credential("bad")]))
+    assert client.get(f"{stub.url}/users/user1").status_code == 401
+    assert len(client.tokens.credentials) == 1
+
+def test_mutation_is_not_retried_on_server_error(stub):
+    stub.faults = [502]
+    body = {"query": "mutation { createAttributionInvitation(input: {}) { source { id } } }"}
+    response = GitHubClient("t1").post(f"{stub.url}/graphql", json=body, idempotent=False)
+    assert response.status_code == 502
+    assert stub.requests == 1
+
+def test_mutation_is_retried_when_rate_limited(stub):
+    stub.faults = [429]
+    body = {"query": "mutation { createAttributionInvitation(input: {}) { source { id } } }"}
+    response = GitHubClient("t1").post(f"{stub.url}/graphql", json=body, idempotent=False)
+    assert response.status_code == 200
+    assert stub.requests == 2
+
+def test_unpooled_client_always_sends_the_callers_token(stub, monkeypatch):
+    monkeypatch.setenv("GITHUB_TOKENS", "pat1,pat2")
+    monkeypatch.setattr(github_client, "_clients", {})
+    assert github_client.get_client("OWNER").tokens is not None
+    for _ in range(3):
+        github_client.get_client("OWNER", pooled=False).get(f"{stub.url}/users/user1")
+    assert stub._used == {("OWNER", "core"): 3}
+
+def test_graphql_budget_does_not_pace_rest_calls(stub):
+    stub.rate_limit, stub.window = 15, 60
+    client = GitHubClient("t1")
+    body = {"query": "query { viewer { login } }"}
+    for _ in range(5):
+        client.post(f"{stub.url}/graphql", json=body)  # GraphQL budget down to the reserve
+    started = time.time()
+    assert client.get(f"{stub.url}/users/user1").status_code == 200
+    assert time.time() - started < 1
+    assert client.rate_limits.governor("graphql").remaining == 10
+    assert client.rate_limits.governor("core").remaining == 14
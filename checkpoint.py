@@ -0,0 +1,60 @@
+import json
+import logging
+import os
+
+RESOLVED = "resolved"
+
+
+# Append-only journal of per-row outcomes keyed by mannequin-id.
+# Each line is a JSON object; the last entry for a mannequin-id wins when the journal is reloaded.
+class ProgressJournal:
+    def __init__(self, path):
+        self.path = path
+        self._targets = {}
+        if os.path.exists(path):
+            with open(path, mode='r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A crash can leave a truncated last line
+                    if entry.get("status") == RESOLVED:
+                        self._targets[entry["mannequin-id"]] = entry["target-user"]
+                    else:
+                        self._targets.pop(entry.get("mannequin-id"), None)
+            logging.info(f"Resuming from {path}: {len(self._targets)} rows already resolved")
+        self._file = open(path, mode='a', encoding='utf-8')
+
+    # Target user recorded for this mannequin-id by a previous run, if it was resolved
+    def resolved_target(self, mannequin_id):
+        return self._targets.get(mannequin_id)
+
+    def record(self, mannequin_id, status, target_user=""):
+        if not mannequin_id:
+            return
+        entry = {"mannequin-id": mannequin_id, "status": status, "target-user": target_user}
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        if status == RESOLVED:
+            self._targets[mannequin_id] = target_user
+
+    def close(self):
+        self._file.close()
+
+# Open the journal when a path is configured, otherwise return None (no checkpointing)
+def open_journal(path):
+    if not path:
+        return None
+    return ProgressJournal(path)
+
+# Return the target-user to keep for this row, or None when the row still needs resolving.
+# Rows that already carry a target-user, or that a previous run resolved, are skipped unless forced.
+def resume_target(mapping, journal=None, force=False):
+    if force:
+        return None
+    target_user = (mapping.get("target-user") or "").strip()
+    if target_user:
+        return target_user
+    if journal is not None:
+        return journal.resolved_target(mapping.get("mannequin-id"))
+    return None
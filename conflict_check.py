@@ -0,0 +1,90 @@
+import csv
+import os
+
+from emu_index import normalize_email
+
+CONFLICT_FIELDNAMES = ["severity", "kind", "value", "count", "details"]
+MAX_DETAILS = 10  # Members listed per finding; the count has the full size
+
+
+# Group the EMU rows by login and by normalized email in one pass.
+# Returns ({login: [distinct emails]}, {email: [distinct logins]}).
+def index_emu(data):
+    logins = data.get("login") or []
+    emails = data.get("saml_name_id") or [None] * len(logins)
+    by_login, by_email = {}, {}
+    for login, email in zip(logins, emails):
+        if login is None or login == "":
+            continue
+        email = normalize_email(email)
+        login_emails = by_login.setdefault(login, [])
+        if email not in login_emails:
+            login_emails.append(email)
+        if email is not None:
+            email_logins = by_email.setdefault(email, [])
+            if login not in email_logins:
+                email_logins.append(login)
+    return by_login, by_email
+
+def _finding(severity, kind, value, members):
+    details = ", ".join(str(member) for member in members[:MAX_DETAILS])
+    if len(members) > MAX_DETAILS:
+        details += f", ... ({len(members) - MAX_DETAILS} more)"
+    return {"severity": severity, "kind": kind, "value": value, "count": len(members), "details": details}
+
+# Scan the mappings once against the grouped EMU index and return the findings, errors first.
+#   duplicate-mannequin-id  the same mannequin-id on several rows (error)
+#   ambiguous-emu-login     a login with rows carrying different emails; an error when a mannequin maps to it,
+#                           because the login flow would silently take the first row
+#   shared-emu-email        several EMU logins with one email (warning; the email flow keeps the first)
+#   target-collision        several mannequin users resolving to one target-user (error)
+# With `org_suffix`, targets the login flow would derive from the EMU email are included in the collision check.
+def find_conflicts(mappings, emu_data=None, org_suffix=None):
+    by_login, by_email = index_emu(emu_data) if emu_data else ({}, {})
+    rows_by_id, users_by_target = {}, {}
+    referenced = set()
+
+    for row in mappings:
+        mannequin_user = (row.get("mannequin-user") or "").strip()
+        mannequin_id = (row.get("mannequin-id") or "").strip()
+        if mannequin_id:
+            rows_by_id.setdefault(mannequin_id, []).append(mannequin_user)
+
+        target_user = (row.get("target-user") or "").strip()
+        if not target_user and org_suffix is not None and mannequin_user in by_login:
+            email = by_login[mannequin_user][0]
+            if email:
+                target_user = f"{email.split('@')[0]}_{org_suffix}"
+        if mannequin_user:
+            referenced.add(mannequin_user)
+            if target_user:
+                target_users = users_by_target.setdefault(target_user.casefold(), [])
+                if mannequin_user not in target_users:
+                    target_users.append(mannequin_user)
+
+    findings = []
+    for mannequin_id, users in rows_by_id.items():
+        if len(users) > 1:
+            findings.append(_finding("error", "duplicate-mannequin-id", mannequin_id, users))
+    for target_user, users in users_by_target.items():
+        if len(users) > 1:
+            findings.append(_finding("error", "target-collision", target_user, users))
+    for login, emails in by_login.items():
+        if len(emails) > 1:
+            severity = "error" if login in referenced else "warning"
+            findings.append(_finding(severity, "ambiguous-emu-login", login, emails))
+    for email, logins in by_email.items():
+        if len(logins) > 1:
+            findings.append(_finding("warning", "shared-emu-email", email, logins))
+    findings.sort(key=lambda finding: finding["severity"] != "error")
+    return findings
+
+def write_conflicts(file_path, findings):
+    with open(file_path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=CONFLICT_FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(findings)
+
+# Conflicts report for one mappings CSV: CONFLICTS_CSV, defaulting to <mappings>.conflicts.csv
+def conflicts_path(mappings_path):
+    return os.getenv("CONFLICTS_CSV") or f"{os.path.splitext(mappings_path)[0]}.conflicts.csv"
@@ -0,0 +1,2 @@
+# chatgpt_test.py and perplexity_test.py are migration scripts that read their settings on import, not tests
+collect_ignore = ["chatgpt_test.py", "perplexity_test.py"]
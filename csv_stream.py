@@ -0,0 +1,59 @@
+import csv
+import os
+import tempfile
+from itertools import islice
+
+from run_metrics import METRICS
+
+MAPPING_FIELDNAMES = ["mannequin-user", "mannequin-id", "target-user"]
+STREAM_CHUNK_SIZE = 1000  # Rows resolved together when a stage needs a batch (GraphQL, concurrency)
+
+
+# Yield the CSV rows one at a time instead of materializing the whole file
+def iter_csv_rows(file_path, encoding='utf-8'):
+    rows = 0
+    try:
+        with open(file_path, mode='r', newline='', encoding=encoding) as file:
+            reader = csv.DictReader(file)
+            while True:
+                with METRICS.stage("csv_read"):
+                    row = next(reader, None)
+                if row is None:
+                    return
+                rows += 1
+                yield row
+    finally:
+        METRICS.add_rows("csv_read", rows)
+
+# Split a row iterator into lists of at most `size` rows
+def iter_chunks(rows, size=STREAM_CHUNK_SIZE):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+# Write rows to a temp file next to file_path, then atomically rename it over the original.
+# `rows` may be a generator that is still reading file_path; the original is only replaced
+# once every row has been written and flushed to disk.
+def write_csv_atomically(file_path, rows, fieldnames=MAPPING_FIELDNAMES, encoding='utf-8'):
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".csv", dir=directory)
+    written = 0
+    try:
+        with METRICS.stage("write_back"), os.fdopen(fd, mode='w', newline='', encoding=encoding) as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                written += 1
+            file.flush()
+            os.fsync(file.fileno())
+        if os.path.exists(file_path):
+            os.chmod(temp_path, os.stat(file_path).st_mode & 0o777)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    METRICS.add_rows("write_back", written)
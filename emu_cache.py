@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import pickle
+import re
+import sys
+import tempfile
+import zipfile
+from xml.etree import ElementTree
+
+EMU_COLUMNS = ("login", "name", "saml_name_id")  # The only EMU columns the matchers read
+SNAPSHOT_VERSION = 1
+XLSX_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+XLSX_RELS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+XLSX_DOC_RELS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+
+# Hash the workbook contents so a re-exported file with the same name gets a fresh snapshot
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# Parse the workbook once in streaming read-only mode, keeping only the requested columns
+def parse_workbook_columns(file_path, columns=EMU_COLUMNS, sheet_name=None):
+    from openpyxl import load_workbook  # Imported here so a snapshot hit never loads openpyxl
+
+    wb = load_workbook(filename=file_path, read_only=True, data_only=True)
+    try:
+        sheet = wb[sheet_name] if sheet_name else wb.active
+        rows = sheet.iter_rows(values_only=True)
+        headers = next(rows, ())
+        positions = {header: index for index, header in enumerate(headers) if header in columns}
+        data = {header: [] for header in positions}
+        for row in rows:
+            if not any(value is not None for value in row):
+                continue  # Trailing blank rows are common in exported sheets
+            for header, index in positions.items():
+                data[header].append(row[index] if index < len(row) else None)
+        return data
+    finally:
+        wb.close()
+
+def _workbook_sheets(archive):
+    workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+    return workbook, workbook.findall(f"{XLSX_MAIN}sheets/{XLSX_MAIN}sheet")
+
+# Sheet names in workbook order, read from the archive without loading any sheet
+def workbook_sheet_names(file_path):
+    with zipfile.ZipFile(file_path) as archive:
+        return [sheet.get("name") for sheet in _workbook_sheets(archive)[1]]
+
+# Archive path of the named sheet, or of the active one like openpyxl's wb.active
+def _sheet_path(archive, sheet_name=None):
+    workbook, sheets = _workbook_sheets(archive)
+    if sheet_name:
+        sheet = next((sheet for sheet in sheets if sheet.get("name") == sheet_name), None)
+        if sheet is None:
+            raise ValueError(f"Sheet {sheet_name} not found in {archive.filename}")
+    else:
+        view = workbook.find(f"{XLSX_MAIN}bookViews/{XLSX_MAIN}workbookView")
+        sheet = sheets[int(view.get("activeTab", 0)) if view is not None else 0]
+    relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    target = next(rel.get("Target") for rel in relationships.iter(f"{XLSX_RELS}Relationship")
+                  if rel.get("Id") == sheet.get(f"{XLSX_DOC_RELS}id"))
+    return target.lstrip("/") if target.startswith("/") else f"xl/{target}"
+
+def _column_index(reference):
+    index = 0
+    for letter in re.match(r"[A-Z]+", reference).group():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+# Read only the header row straight from the xlsx archive. openpyxl's read-only mode scans the
+# whole sheet for its dimensions when an export leaves them out, which takes seconds on big files.
+def read_workbook_header(file_path, sheet_name=None):
+    with zipfile.ZipFile(file_path) as archive:
+        cells = {}
+        with archive.open(_sheet_path(archive, sheet_name)) as sheet:
+            for _, element in ElementTree.iterparse(sheet):
+                if element.tag == f"{XLSX_MAIN}c":
+                    text = element.findtext(f"{XLSX_MAIN}v")
+                    if element.get("t") == "inlineStr":
+                        text = "".join(node.text or "" for node in element.iter(f"{XLSX_MAIN}t"))
+                    cells[_column_index(element.get("r"))] = (element.get("t"), text)
+                elif element.tag == f"{XLSX_MAIN}row":
+                    break
+
+        # Shared-string headers are resolved by streaming the table only as far as they need
+        wanted = {int(text) for kind, text in cells.values() if kind == "s"}
+        shared = {}
+        if wanted:
+            with archive.open("xl/sharedStrings.xml") as strings:
+                position = 0
+                for _, element in ElementTree.iterparse(strings):
+                    if element.tag != f"{XLSX_MAIN}si":
+                        continue
+                    if position in wanted:
+                        shared[position] = "".join(node.text or "" for node in element.iter(f"{XLSX_MAIN}t"))
+                    element.clear()
+                    position += 1
+                    if position > max(wanted):
+                        break
+
+    header = [None] * (max(cells) + 1 if cells else 0)
+    for index, (kind, text) in cells.items():
+        header[index] = shared.get(int(text)) if kind == "s" else text
+    return header
+
+# Load the EMU columns from the snapshot cache, parsing and caching the workbook on a miss
+def load_emu_columns(file_path, cache_dir, columns=EMU_COLUMNS, sheet_name=None):
+    if not cache_dir:
+        return parse_workbook_columns(file_path, columns, sheet_name)
+
+    key = hashlib.sha256(repr((SNAPSHOT_VERSION, file_digest(file_path), tuple(columns), sheet_name)).encode()).hexdigest()
+    snapshot_path = os.path.join(cache_dir, f"emu-{key[:32]}.pickle")
+    if os.path.exists(snapshot_path):
+        try:
+            with open(snapshot_path, 'rb') as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            logging.warning(f"Ignoring unreadable EMU snapshot {snapshot_path}")
+
+    data = parse_workbook_columns(file_path, columns, sheet_name)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", dir=cache_dir)
+    with os.fdopen(fd, 'wb') as file:
+        pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, snapshot_path)
+    logging.info(f"Cached EMU snapshot for {file_path} at {snapshot_path}")
+    return data
+
+# One EMU user holding only the matcher columns. Slots make it a fraction of the size of a
+# per-row dict, while user['login'] and user.get('name') keep working as they did on dicts.
+class EmuUser:
+    __slots__ = EMU_COLUMNS
+
+    def __init__(self, login=None, name=None, saml_name_id=None):
+        self.login = login
+        self.name = name
+        self.saml_name_id = saml_name_id
+
+    def __getitem__(self, column):
+        if column not in EMU_COLUMNS:
+            raise KeyError(column)
+        return getattr(self, column)
+
+    def get(self, column, default=None):
+        return getattr(self, column) if column in EMU_COLUMNS else default
+
+    def __repr__(self):
+        return f"EmuUser(login={self.login!r}, name={self.name!r}, saml_name_id={self.saml_name_id!r})"
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+# Turn the column lists into compact EmuUser records for the email matchers, interning the strings
+def columns_to_records(data):
+    rows = len(next(iter(data.values()), []))
+    columns = [data.get(column) or [None] * rows for column in EMU_COLUMNS]
+    return [EmuUser(*map(_intern, values)) for values in zip(*columns)]
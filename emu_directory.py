@@ -0,0 +1,135 @@
+import csv
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from emu_cache import EMU_COLUMNS, load_emu_columns, read_workbook_header, workbook_sheet_names
+from emu_index import normalize_email
+
+EMU_LOAD_WORKERS = int(os.getenv("EMU_LOAD_WORKERS") or os.cpu_count() or 1)  # Sheets parsed in parallel
+EMU_COLLISIONS_CSV = os.getenv("EMU_COLLISIONS_CSV", "emu-collisions.csv")  # Written only when collisions exist
+COLLISION_FIELDNAMES = [
+    "field", "value", "action",
+    "first-source", "first-login", "first-saml_name_id",
+    "other-source", "other-login", "other-saml_name_id",
+]
+
+
+# An EMU source list is a comma-separated set of workbooks, directories of workbooks, or
+# "workbook.xlsx#Sheet" entries. A single plain workbook keeps the one-active-sheet behaviour.
+def is_emu_directory(spec):
+    return bool(spec) and ("," in spec or "#" in spec or os.path.isdir(spec))
+
+# Expand a source list into (workbook, sheet) units in a stable order; bare workbooks contribute every sheet
+def expand_emu_sources(spec):
+    units = []
+    for entry in (part.strip() for part in spec.split(",")):
+        if not entry:
+            continue
+        path, _, sheet = entry.partition("#")
+        if os.path.isdir(path):
+            workbooks = sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if name.lower().endswith(".xlsx") and not name.startswith("~$")  # Skip Excel lock files
+            )
+        elif os.path.exists(path):
+            workbooks = [path]
+        else:
+            raise FileNotFoundError(f"EMU source {path} not found")
+        for workbook in workbooks:
+            sheets = [sheet] if sheet else workbook_sheet_names(workbook)
+            units.extend((workbook, sheet_name) for sheet_name in sheets)
+    return units
+
+def _source_label(workbook, sheet_name):
+    return f"{os.path.basename(workbook)}#{sheet_name}"
+
+# Worker: parse one sheet (through the snapshot cache when configured); sheets without a login column are skipped
+def _load_sheet(unit):
+    workbook, sheet_name, cache_dir, columns = unit
+    if "login" not in read_workbook_header(workbook, sheet_name):
+        return None
+    return load_emu_columns(workbook, cache_dir, columns, sheet_name)
+
+# Merge per-sheet columns into one directory keyed by login. The first row for a login wins;
+# exact repeats are dropped quietly, conflicting ones are reported. Emails shared by different
+# logins are reported too, but both rows are kept because the login matcher can still use them.
+def merge_emu_sources(sources, columns=EMU_COLUMNS):
+    merged = {column: [] for column in columns}
+    first_by_login, first_by_email = {}, {}
+    collisions, repeats = [], 0
+
+    for label, data in sources:
+        rows = zip(*(data.get(column) or [None] * len(data.get("login", [])) for column in columns))
+        for values in rows:
+            row = dict(zip(columns, values))
+            login = row.get("login")
+            if login is None or login == "":
+                continue
+            first = first_by_login.get(login)
+            if first is not None:
+                if all(first[1].get(column) == row.get(column) for column in columns):
+                    repeats += 1
+                else:
+                    collisions.append(("login", login, "dropped", first, (label, row)))
+                continue
+            first_by_login[login] = (label, row)
+
+            email = normalize_email(row.get("saml_name_id"))
+            if email is not None:
+                if email in first_by_email:
+                    collisions.append(("saml_name_id", email, "kept", first_by_email[email], (label, row)))
+                else:
+                    first_by_email[email] = (label, row)
+
+            for column in columns:
+                merged[column].append(row.get(column))
+    return merged, collisions, repeats
+
+def write_collisions(file_path, collisions):
+    with open(file_path, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=COLLISION_FIELDNAMES)
+        writer.writeheader()
+        for field, value, action, (first_label, first_row), (other_label, other_row) in collisions:
+            writer.writerow({
+                "field": field, "value": value, "action": action,
+                "first-source": first_label, "first-login": first_row.get("login"),
+                "first-saml_name_id": first_row.get("saml_name_id"),
+                "other-source": other_label, "other-login": other_row.get("login"),
+                "other-saml_name_id": other_row.get("saml_name_id"),
+            })
+
+# Load every sheet of an EMU source list on a process pool and merge them into one directory.
+# Wall time tracks the largest sheet rather than the sum, as long as there are workers to spare.
+def load_emu_directory(spec, cache_dir=None, columns=EMU_COLUMNS, workers=EMU_LOAD_WORKERS, collisions_path=EMU_COLLISIONS_CSV):
+    units = [(workbook, sheet_name, cache_dir, tuple(columns)) for workbook, sheet_name in expand_emu_sources(spec)]
+    workers = max(1, min(workers, len(units)))
+    logging.info(f"Loading {len(units)} EMU sheets from {spec} on {workers} workers")
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_load_sheet, units))
+    else:
+        results = [_load_sheet(unit) for unit in units]
+
+    sources = []
+    for (workbook, sheet_name, _, _), data in zip(units, results):
+        if data is None:
+            logging.warning(f"Skipping sheet {_source_label(workbook, sheet_name)}: no 'login' column")
+            continue
+        sources.append((_source_label(workbook, sheet_name), data))
+    if not sources:
+        raise ValueError(f"No EMU sheet in {spec} has a 'login' column")
+
+    merged, collisions, repeats = merge_emu_sources(sources, columns)
+    logging.info(f"EMU directory: {len(merged[columns[0]])} users from {len(sources)} sheets, "
+                 f"{repeats} repeated rows dropped, {len(collisions)} collisions")
+    if collisions and collisions_path:
+        write_collisions(collisions_path, collisions)
+        logging.warning(f"{len(collisions)} EMU key collisions written to {collisions_path}")
+    return merged
+
+# Load EMU columns from either a single workbook (active sheet) or an EMU source list
+def load_emu_sources(spec, cache_dir=None, columns=EMU_COLUMNS):
+    if is_emu_directory(spec):
+        return load_emu_directory(spec, cache_dir, columns)
+    return load_emu_columns(spec, cache_dir, columns)
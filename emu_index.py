@@ -0,0 +1,48 @@
+import logging
+
+
+# Parse "alias.example.com=example.com,other.example=example.com" into {alias: canonical}
+def parse_alias_domains(value):
+    alias_domains = {}
+    for pair in (value or "").split(","):
+        if "=" not in pair:
+            continue
+        alias, canonical = pair.split("=", 1)
+        alias, canonical = alias.strip().casefold(), canonical.strip().casefold()
+        if alias and canonical:
+            alias_domains[alias] = canonical
+    return alias_domains
+
+# Normalize an email so case and whitespace variants (and alias domains) compare equal
+def normalize_email(email, alias_domains=None):
+    if not isinstance(email, str):
+        return None
+    email = email.strip().casefold()
+    if not email:
+        return None
+    local, sep, domain = email.rpartition("@")
+    if not sep:
+        return email
+    if alias_domains:
+        domain = alias_domains.get(domain, domain)
+    return f"{local}@{domain}"
+
+# Build a one-time index from normalized email to EMU record (first record wins)
+def build_email_index(emu_users, alias_domains=None, email_field="saml_name_id"):
+    index = {}
+    for user in emu_users:
+        email = normalize_email(user[email_field], alias_domains)
+        if email is None:
+            continue
+        if email in index:
+            logging.debug(f"Duplicate {email_field} {email}; keeping the first EMU record")
+            continue
+        index[email] = user
+    return index
+
+# Resolve an email against the index built by build_email_index
+def lookup_email(index, email, alias_domains=None):
+    normalized = normalize_email(email, alias_domains)
+    if normalized is None:
+        return None
+    return index.get(normalized)
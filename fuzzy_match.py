@@ -0,0 +1,185 @@
+import csv
+import heapq
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+
+from run_metrics import METRICS
+
+FUZZY_THRESHOLD = 0.9  # Confidence at or above which a fuzzy candidate is applied
+FUZZY_MIN_SCORE = 0.6  # Candidates below this are not even worth a manual review
+FUZZY_TIE_MARGIN = 0.02  # A runner-up this close to the best candidate makes the match ambiguous
+MAX_CANDIDATES = 20  # Candidates scored per query after blocking
+REVIEW_FIELDNAMES = [
+    "mannequin-user", "mannequin-id", "candidate-login", "candidate-name", "matched-on", "confidence",
+    "runner-up-login", "runner-up-confidence",
+]
+
+
+# Casefold, strip accents and collapse punctuation so "José_Smith-Jr" and "jose smith jr" compare equal
+def normalize_name(value):
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", str(value))
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(re.split(r"[^0-9a-z]+", value.casefold())).strip()
+
+# EMU logins carry the enterprise shortcode after the last underscore ("jsmith_acme"); match on the handle
+def normalize_login(login):
+    handle = str(login or "")
+    if "_" in handle:
+        handle = handle.rsplit("_", 1)[0]
+    return normalize_name(handle)
+
+def ngrams(text, size=3):
+    padded = f" {text} "
+    return {padded[index:index + size] for index in range(len(padded) - size + 1)}
+
+def similarity(left, right):
+    if not left or not right:
+        return 0.0
+    score = SequenceMatcher(None, left, right).ratio()
+    # Word order differs between display names ("Smith John") and handles ("john-smith")
+    left_sorted, right_sorted = " ".join(sorted(left.split())), " ".join(sorted(right.split()))
+    if (left_sorted, right_sorted) != (left, right):
+        score = max(score, SequenceMatcher(None, left_sorted, right_sorted).ratio())
+    return score
+
+
+# Trigram blocking index over the EMU `login` and `name` columns. A query only scores the users
+# that share its rarer trigrams, so lookups stay far below a scan of every EMU user.
+class FuzzyIndex:
+    def __init__(self, emu_users, max_postings=None):
+        self.records = []
+        self._keys = []  # (normalized text, record position, column) per indexed value
+        self._postings = {}
+        for user in emu_users:
+            position = len(self.records)
+            self.records.append(user)
+            for column, text in (("login", normalize_login(user.get("login"))), ("name", normalize_name(user.get("name")))):
+                if not text:
+                    continue
+                key = len(self._keys)
+                self._keys.append((text, position, column))
+                for gram in ngrams(text):
+                    self._postings.setdefault(gram, []).append(key)
+        # Trigrams shared by a large share of users ("son", " jo") say little and cost a lot to scan
+        self.max_postings = max_postings or max(50, len(self._keys) // 20)
+
+    # Score the candidates that share the most trigrams with `query`: {record position: (confidence, column)}
+    def scores(self, query):
+        text = normalize_name(query)
+        if not text:
+            return {}
+        overlap = {}
+        for gram in ngrams(text):
+            postings = self._postings.get(gram)
+            if not postings or len(postings) > self.max_postings:
+                continue
+            for key in postings:
+                overlap[key] = overlap.get(key, 0) + 1
+        scores = {}
+        for key in heapq.nlargest(MAX_CANDIDATES, overlap, key=overlap.get):
+            candidate_text, position, column = self._keys[key]
+            score = similarity(text, candidate_text)
+            if position not in scores or score > scores[position][0]:
+                scores[position] = (score, column)
+        return scores
+
+    # Best EMU user for `query` as (user, confidence, column), or None when nothing shares enough trigrams
+    def best_match(self, query):
+        scores = self.scores(query)
+        if not scores:
+            return None
+        position = max(scores, key=lambda candidate: scores[candidate][0])
+        return self.records[position], scores[position][0], scores[position][1]
+
+
+def _has_email(user):
+    email = user.get("saml_name_id")
+    return isinstance(email, str) and email.strip() != ""
+
+# Fallback matcher used after the exact lookup fails. Confident matches are returned to the caller;
+# candidates between FUZZY_MIN_SCORE and the threshold are written to a review CSV instead, as are
+# confident ones when a different EMU user scores within `tie_margin` of them (two "John Smith"s).
+# With require_email, users without a saml_name_id are never candidates (the login flows need it).
+class FuzzyMatcher:
+    def __init__(self, emu_users, threshold=FUZZY_THRESHOLD, min_score=FUZZY_MIN_SCORE, review_path=None,
+                 tie_margin=FUZZY_TIE_MARGIN, require_email=False):
+        if require_email:
+            emu_users = (user for user in emu_users if _has_email(user))
+        with METRICS.stage("fuzzy_index"):
+            self.index = FuzzyIndex(emu_users)
+        METRICS.add_rows("fuzzy_index", len(self.index.records))
+        self.threshold = threshold
+        self.min_score = min_score
+        self.tie_margin = tie_margin
+        self.review_path = review_path
+        self.reviewed = 0
+        self._review_file = None
+        self._review_writer = None
+
+    # Return (user, confidence) for a confident match, otherwise None (queueing any near miss for review).
+    # `queries` are tried in order, e.g. the mannequin login and the local part of its email.
+    def match(self, mapping, queries):
+        with METRICS.stage("fuzzy_matching"):
+            scores = {}
+            for query in queries:
+                for position, (score, column) in self.index.scores(query).items():
+                    if position not in scores or score > scores[position][0]:
+                        scores[position] = (score, column)
+            ranked = sorted(scores, key=lambda position: scores[position][0], reverse=True)
+        METRICS.add_rows("fuzzy_matching", 1)
+        if not ranked or scores[ranked[0]][0] < self.min_score:
+            return None
+        user = self.index.records[ranked[0]]
+        score, column = scores[ranked[0]]
+        # Runner-up: the best candidate that is a different EMU user, not the same login on another row
+        runner_up = next((position for position in ranked[1:] if self.index.records[position].get("login") != user.get("login")), None)
+        runner_up_score = scores[runner_up][0] if runner_up is not None else None
+        if score >= self.threshold and (runner_up_score is None or score - runner_up_score >= self.tie_margin):
+            METRICS.count("fuzzy_matched")
+            return user, score
+        if score >= self.threshold:
+            METRICS.count("fuzzy_ambiguous")
+        runner_up_user = self.index.records[runner_up] if runner_up is not None else None
+        self._write_review(mapping, user, score, column, runner_up_user, runner_up_score)
+        METRICS.count("fuzzy_review")
+        return None
+
+    def _write_review(self, mapping, user, score, column, runner_up=None, runner_up_score=None):
+        if not self.review_path:
+            return
+        if self._review_writer is None:
+            self._review_file = open(self.review_path, mode='w', newline='', encoding='utf-8')
+            self._review_writer = csv.DictWriter(self._review_file, fieldnames=REVIEW_FIELDNAMES)
+            self._review_writer.writeheader()
+        self._review_writer.writerow({
+            "mannequin-user": mapping.get("mannequin-user"),
+            "mannequin-id": mapping.get("mannequin-id"),
+            "candidate-login": user.get("login"),
+            "candidate-name": user.get("name"),
+            "matched-on": column,
+            "confidence": f"{score:.3f}",
+            "runner-up-login": runner_up.get("login") if runner_up is not None else "",
+            "runner-up-confidence": f"{runner_up_score:.3f}" if runner_up_score is not None else "",
+        })
+        self.reviewed += 1
+
+    def close(self):
+        if self._review_file is not None:
+            self._review_file.close()
+
+# Build the fallback matcher for one mappings CSV. FUZZY_THRESHOLD, FUZZY_MIN_SCORE and FUZZY_TIE_MARGIN
+# override the defaults; FUZZY_REVIEW_CSV sets the review file, which defaults to <mappings>.review.csv.
+def open_fuzzy_matcher(emu_users, mappings_path, require_email=False):
+    review_path = os.getenv("FUZZY_REVIEW_CSV") or f"{os.path.splitext(mappings_path)[0]}.review.csv"
+    return FuzzyMatcher(
+        emu_users,
+        threshold=float(os.getenv("FUZZY_THRESHOLD") or FUZZY_THRESHOLD),
+        min_score=float(os.getenv("FUZZY_MIN_SCORE") or FUZZY_MIN_SCORE),
+        review_path=review_path,
+        tie_margin=float(os.getenv("FUZZY_TIE_MARGIN") or FUZZY_TIE_MARGIN),
+        require_email=require_email,
+    )
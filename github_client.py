@@ -0,0 +1,331 @@
+import calendar
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from run_metrics import METRICS
+
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com")  # Overridable for local API stand-ins
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # Seconds; doubled on every retry before jitter is applied
+BACKOFF_CAP = 60.0
+POOL_SIZE = 32  # Keep-alive connections shared by concurrent lookups
+PACE_THRESHOLD = 0.2  # Start spreading requests once less than 20% of the budget is left
+RATE_LIMIT_RESERVE = 10  # Requests kept back; at this point we wait for the reset
+APP_TOKEN_REFRESH_MARGIN = 300  # Seconds before expiry at which an installation token is replaced
+REQUEST_TIMEOUT = 30  # Seconds to wait for a connection or response before the attempt is retried
+
+
+# Tracks X-RateLimit-* headers and spaces requests so the budget lasts until the reset
+class RateLimitGovernor:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.limit = None
+        self.remaining = None
+        self.reset_at = None
+        self._next_slot = 0.0
+
+    def update(self, headers):
+        try:
+            limit = int(headers["X-RateLimit-Limit"])
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_at = float(headers["X-RateLimit-Reset"])
+        except (KeyError, TypeError, ValueError):
+            return
+        with self._lock:
+            # Responses from concurrent threads arrive out of order; keep the lowest count per window
+            if self.reset_at != reset_at or self.remaining is None or remaining < self.remaining:
+                self.limit, self.remaining, self.reset_at = limit, remaining, reset_at
+
+    # Block until the next request may be sent
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot)
+            if self.remaining is not None and self.reset_at is not None and self.reset_at > now:
+                if self.remaining <= RATE_LIMIT_RESERVE:
+                    # Budget spent: every worker holds until the window resets
+                    slot = max(slot, self.reset_at + 1)
+                    self._next_slot = slot
+                    self.remaining = None  # Re-learn the budget from the first response after the reset
+                elif self.remaining < self.limit * PACE_THRESHOLD:
+                    self._next_slot = slot + (self.reset_at - now) / (self.remaining - RATE_LIMIT_RESERVE)
+            delay = slot - now
+        if delay > 0:
+            METRICS.count("rate_limit_wait_seconds", delay)
+            if delay > 1:
+                logging.info(f"Rate limit pacing: waiting {delay:.1f}s")
+            time.sleep(delay)
+
+
+# REST and GraphQL calls draw on separate budgets with their own reset times (X-RateLimit-Resource);
+# the bucket a request will hit is known from its URL, the one it did hit from the response
+def rate_limit_resource(url):
+    return "graphql" if url.rstrip("/").endswith("/graphql") else "core"
+
+# One RateLimitGovernor per rate-limit resource, so a spent GraphQL budget never paces REST calls
+class RateLimits:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._governors = {}
+
+    def governor(self, resource):
+        with self._lock:
+            governor = self._governors.get(resource)
+            if governor is None:
+                governor = self._governors[resource] = RateLimitGovernor()
+            return governor
+
+    def update(self, headers, resource):
+        self.governor(headers.get("X-RateLimit-Resource") or resource).update(headers)
+
+
+# A personal access token with its own rate-limit budgets
+class Credential:
+    def __init__(self, token=None, label=None):
+        self._token = token
+        self.key = token
+        self.label = label or f"token ...{(token or '')[-4:]}"
+        self.rate_limits = RateLimits()
+
+    def token(self):
+        return self._token
+
+    # Requests left in the resource's current window; unknown or already reset budgets count as full
+    def budget(self, now, resource="core"):
+        governor = self.rate_limits.governor(resource)
+        if governor.remaining is None or governor.reset_at is None or governor.reset_at <= now:
+            return float("inf")
+        return governor.remaining - RATE_LIMIT_RESERVE
+
+
+# Mint a GitHub App installation token from the app's private key; returns (token, expiry epoch seconds)
+def mint_installation_token(app_id, private_key, installation_id):
+    try:
+        import jwt  # PyJWT with the crypto extra; only needed for GitHub App credentials
+    except ImportError:
+        raise RuntimeError("GitHub App credentials need PyJWT: pip install 'pyjwt[crypto]'")
+    now = int(time.time())
+    app_jwt = jwt.encode({"iat": now - 60, "exp": now + 540, "iss": str(app_id)}, private_key, algorithm="RS256")
+    response = requests.post(
+        f"{GITHUB_API_URL}/app/installations/{installation_id}/access_tokens",
+        headers={"Authorization": f"Bearer {app_jwt}", "Accept": "application/vnd.github.v3+json"},
+        timeout=30,
+    )
+    if response.status_code != 201:
+        raise RuntimeError(f"Minting a token for installation {installation_id} failed: {response.status_code} {response.text}")
+    body = response.json()
+    METRICS.count("app_tokens_minted")
+    return body["token"], calendar.timegm(time.strptime(body["expires_at"], "%Y-%m-%dT%H:%M:%SZ"))
+
+# A GitHub App installation; its hour-long token is minted locally and replaced before it expires
+class AppInstallationCredential(Credential):
+    def __init__(self, app_id, private_key, installation_id):
+        super().__init__(label=f"app {app_id} installation {installation_id}")
+        self.key = ("app", app_id, installation_id)
+        self.app_id = app_id
+        self.private_key = private_key
+        self.installation_id = installation_id
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def token(self):
+        with self._lock:
+            if time.time() > self._expires_at - APP_TOKEN_REFRESH_MARGIN:
+                self._token, self._expires_at = mint_installation_token(self.app_id, self.private_key, self.installation_id)
+                self.rate_limits = RateLimits()  # A new token starts new budgets
+            return self._token
+
+
+# Credentials shared by one client. Each request goes to the credential with the most budget left
+# (round-robin among equals); credentials rejected with 401/403 are dropped, except the last one.
+class TokenPool:
+    def __init__(self, credentials=()):
+        self._lock = threading.Lock()
+        self.credentials = []
+        self._keys = set()  # Every credential ever added, so a removed one is not added back
+        self._turn = 0
+        for credential in credentials:
+            self.add(credential)
+
+    def add(self, credential):
+        with self._lock:
+            if credential.key not in self._keys:
+                self._keys.add(credential.key)
+                self.credentials.append(credential)
+
+    # Add a plain token unless it is already pooled (or was removed from the pool)
+    def add_token(self, token):
+        if token not in self._keys:
+            self.add(Credential(token))
+
+    def acquire(self, resource="core"):
+        with self._lock:
+            if not self.credentials:
+                raise RuntimeError("No GitHub credentials configured")
+            now = time.time()
+            self._turn = (self._turn + 1) % len(self.credentials)
+            rotated = self.credentials[self._turn:] + self.credentials[:self._turn]
+            # Once every budget is spent, the credential whose window resets first is the one to wait on
+            return max(rotated, key=lambda credential: (
+                credential.budget(now, resource), -(credential.rate_limits.governor(resource).reset_at or 0)
+            ))
+
+    # True when another credential still has budget, so a rate-limited request can move on without waiting
+    def has_budget(self, exclude=None, resource="core"):
+        with self._lock:
+            now = time.time()
+            return any(credential.budget(now, resource) > 0 for credential in self.credentials if credential is not exclude)
+
+    def remove(self, credential, reason):
+        with self._lock:
+            if credential not in self.credentials or len(self.credentials) == 1:
+                return False
+            self.credentials.remove(credential)
+        logging.warning(f"Removing {credential.label} from the token pool ({reason})")
+        METRICS.count("credentials_removed")
+        return True
+
+
+# One pooled keep-alive session per token with retries and rate-limit pacing. With a TokenPool the
+# session is shared and each request is sent with the pool's best credential instead.
+class GitHubClient:
+    def __init__(self, token=None, max_retries=MAX_RETRIES, pool_size=POOL_SIZE, tokens=None, timeout=REQUEST_TIMEOUT):
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.tokens = tokens
+        self.rate_limits = RateLimits()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["Accept"] = "application/vnd.github.v3+json"
+        if token:
+            self.session.headers["Authorization"] = f"token {token}"
+
+    def get(self, url, headers=None, params=None):
+        return self.request("GET", url, headers=headers, params=params)
+
+    # Mutations pass idempotent=False: a 5xx or a dropped connection may come after GitHub applied them,
+    # so only responses that prove the request was not processed (rate limits, connect timeouts) are retried
+    def post(self, url, json=None, headers=None, idempotent=True):
+        return self.request("POST", url, headers=headers, json=json, idempotent=idempotent)
+
+    def request(self, method, url, idempotent=True, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        resource = rate_limit_resource(url)
+        for attempt in range(self.max_retries + 1):
+            credential = self.tokens.acquire(resource) if self.tokens is not None else None
+            rate_limits = credential.rate_limits if credential is not None else self.rate_limits
+            if credential is not None:
+                try:
+                    token = credential.token()
+                except RuntimeError as e:
+                    # An installation whose token cannot be minted is treated like a rejected credential
+                    logging.error(str(e))
+                    if self.tokens.remove(credential, "token mint failure"):
+                        continue
+                    raise
+                # Replaces the Authorization header the caller built from its own token
+                kwargs["headers"] = {**(kwargs.get("headers") or {}), "Authorization": f"token {token}"}
+            rate_limits.governor(resource).wait()
+            METRICS.count("api_calls")
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries or not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                    raise
+                self._backoff(attempt, None, f"{'timeout' if isinstance(e, requests.Timeout) else 'connection error'}: {e}")
+                continue
+
+            rate_limits.update(response.headers, resource)
+            retry = self._should_retry(response, idempotent)
+            if credential is not None and not retry and response.status_code in (401, 403):
+                # A revoked or unauthorized credential; the same request goes to the next one
+                if self.tokens.remove(credential, f"HTTP {response.status_code}"):
+                    continue
+            if attempt == self.max_retries or not retry:
+                return response
+            if credential is not None and response.status_code < 500 and self.tokens.has_budget(exclude=credential, resource=resource):
+                METRICS.count("api_retries")
+                continue  # Rate limited: another credential still has budget, so no need to wait
+            self._backoff(attempt, response, f"HTTP {response.status_code}")
+        return response
+
+    # Primary/secondary rate limits (403/429) and, for idempotent requests, transient 5xx responses are retried
+    def _should_retry(self, response, idempotent=True):
+        if response.status_code == 429:
+            return True
+        if response.status_code in (502, 503, 504):
+            return idempotent
+        if response.status_code == 403:
+            return (
+                response.headers.get("X-RateLimit-Remaining") == "0"
+                or "Retry-After" in response.headers
+                or "rate limit" in response.text.lower()
+            )
+        # GraphQL reports a spent budget as a 200 response carrying a RATE_LIMITED error
+        if response.status_code == 200 and response.request is not None and response.request.method == "POST":
+            return '"RATE_LIMITED"' in response.text
+        return False
+
+    def _backoff(self, attempt, response, reason):
+        METRICS.count("api_retries")
+        headers = response.headers if response is not None else {}
+        if "Retry-After" in headers:
+            delay = float(headers["Retry-After"])
+        elif headers.get("X-RateLimit-Remaining") == "0" and "X-RateLimit-Reset" in headers:
+            delay = max(0.0, float(headers["X-RateLimit-Reset"]) - time.time()) + 1
+        else:
+            # Full jitter keeps concurrent workers from retrying in lockstep
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        logging.warning(f"Retrying after {reason} in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries})")
+        METRICS.count("retry_wait_seconds", delay)
+        time.sleep(delay)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Extra credentials from the environment: GITHUB_TOKENS (comma-separated PATs) and, with PyJWT
+# installed, GITHUB_APP_ID + GITHUB_APP_PRIVATE_KEY (PEM or a path to it) + GITHUB_APP_INSTALLATION_IDS
+def pool_credentials():
+    credentials = [Credential(token.strip()) for token in os.getenv("GITHUB_TOKENS", "").split(",") if token.strip()]
+    app_id = os.getenv("GITHUB_APP_ID")
+    if app_id:
+        private_key = os.getenv("GITHUB_APP_PRIVATE_KEY", "")
+        if private_key and os.path.exists(private_key):
+            with open(private_key, mode='r', encoding='utf-8') as file:
+                private_key = file.read()
+        for installation_id in os.getenv("GITHUB_APP_INSTALLATION_IDS", "").split(","):
+            if installation_id.strip():
+                credentials.append(AppInstallationCredential(app_id, private_key, installation_id.strip()))
+    return credentials
+
+# Return the shared client for this token, creating it on first use. When extra credentials are
+# configured, every caller shares one client whose pool holds them plus each token passed in here.
+# Calls that only the caller's token may make (org-owner queries and mutations) pass pooled=False
+# to get a client that always sends that token.
+def get_client(token=None, pooled=True):
+    with _clients_lock:
+        pool = None
+        if pooled:
+            if "pool" not in _clients:
+                credentials = pool_credentials()
+                _clients["pool"] = GitHubClient(tokens=TokenPool(credentials)) if credentials else None
+                if credentials:
+                    logging.info(f"Spreading GitHub requests over {len(credentials)} pooled credentials")
+            pool = _clients["pool"]
+        if pool is not None:
+            if token:
+                pool.tokens.add_token(token)
+            return pool
+        client = _clients.get(token)
+        if client is None:
+            client = _clients[token] = GitHubClient(token)
+        return client
@@ -0,0 +1,120 @@
+import logging
+from itertools import islice
+
+from github_client import GITHUB_API_URL, get_client
+
+GITHUB_GRAPHQL_URL = f"{GITHUB_API_URL}/graphql"
+GRAPHQL_BATCH_SIZE = 100  # Logins packed into a single GraphQL request
+
+# Build one query with an aliased user(login:) field per login
+def build_user_batch_query(logins, fields="login email"):
+    variables = {f"login{index}": login for index, login in enumerate(logins)}
+    params = ", ".join(f"${name}: String!" for name in variables)
+    aliases = "\n".join(f"  u{index}: user(login: $login{index}) {{ {fields} }}" for index in range(len(logins)))
+    return f"query({params}) {{\n{aliases}\n}}", variables
+
+# Fetch `fields` of up to `batch_size` logins per GraphQL request and return {login: user};
+# logins that do not exist are left out
+# Logins whose lookup failed (HTTP error or a non-NOT_FOUND GraphQL error) are added to `failed` when given.
+def fetch_users_batch(logins, token, fields, batch_size=GRAPHQL_BATCH_SIZE, failed=None):
+    headers = {
+        "Authorization": f"bearer {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    seen = set()
+    unique_logins = (login for login in logins if login and not (login in seen or seen.add(login)))
+    users = {}
+
+    # Pull logins lazily so a paginated member generator is consumed one batch at a time
+    while True:
+        batch = list(islice(unique_logins, batch_size))
+        if not batch:
+            break
+        query, variables = build_user_batch_query(batch, fields)
+        response = get_client(token).post(GITHUB_GRAPHQL_URL, json={"query": query, "variables": variables}, headers=headers)
+        if response.status_code != 200:
+            logging.error(f"Error fetching users: {response.status_code}")
+            if failed is not None:
+                failed.update(batch)
+            continue
+
+        payload = response.json()
+        # Unknown logins come back as null fields plus NOT_FOUND errors; the rest of the batch still resolves
+        not_found = set()
+        for error in payload.get("errors") or []:
+            if error.get("type") == "NOT_FOUND":
+                not_found.update(error.get("path") or [])
+            else:
+                logging.error(f"GraphQL error fetching users: {error.get('message')}")
+
+        data = payload.get("data") or {}
+        for index, login in enumerate(batch):
+            user = data.get(f"u{index}")
+            if user:
+                users[login] = user
+            elif failed is not None and f"u{index}" not in not_found:
+                failed.add(login)
+
+    return users
+
+# Fetch the public email for up to `batch_size` logins per GraphQL request
+def fetch_user_emails_batch(logins, token, batch_size=GRAPHQL_BATCH_SIZE, failed=None):
+    users = fetch_users_batch(logins, token, "login email", batch_size, failed)
+    return {login: user["email"] for login, user in users.items() if user.get("email")}  # Map username to email
+
+# Fetch the node ID of each login, as needed by mutations that take a user ID
+def fetch_user_ids_batch(logins, token, batch_size=GRAPHQL_BATCH_SIZE, failed=None):
+    users = fetch_users_batch(logins, token, "login id", batch_size, failed)
+    return {login: user["id"] for login, user in users.items() if user.get("id")}
+
+SAML_IDENTITIES_QUERY = """query($login: String!, $after: String) {
+  organization(login: $login) {
+    samlIdentityProvider {
+      externalIdentities(first: 100, after: $after) {
+        pageInfo { endCursor hasNextPage }
+        nodes { samlIdentity { nameId } scimIdentity { username } user { login } }
+      }
+    }
+  }
+}"""
+
+# Sweep the org's SAML external identities 100 per request and return {casefolded login: nameId}.
+# Unlike the public profile email, the SAML nameId is set for every linked member, so one pass of
+# N/100 calls replaces a profile lookup per user. Identities without a linked user are skipped.
+def fetch_saml_emails(org_name, token):
+    headers = {
+        "Authorization": f"bearer {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    login_to_email, after = {}, None
+    while True:
+        variables = {"login": org_name, "after": after}
+        response = get_client(token).post(GITHUB_GRAPHQL_URL, json={"query": SAML_IDENTITIES_QUERY, "variables": variables}, headers=headers)
+        if response.status_code != 200:
+            raise RuntimeError(f"Error fetching SAML identities of {org_name}: {response.status_code}")
+        payload = response.json()
+        provider = ((payload.get("data") or {}).get("organization") or {}).get("samlIdentityProvider")
+        if provider is None:
+            messages = "; ".join(error.get("message", "") for error in payload.get("errors") or [])
+            raise RuntimeError(f"Organization {org_name} has no SAML identity provider visible to this token{': ' + messages if messages else ''}")
+
+        identities = provider["externalIdentities"]
+        for node in identities["nodes"]:
+            user = node.get("user")
+            email = (node.get("samlIdentity") or {}).get("nameId") or (node.get("scimIdentity") or {}).get("username")
+            if user and email:
+                login_to_email[user["login"].casefold()] = email
+        if not identities["pageInfo"]["hasNextPage"]:
+            break
+        after = identities["pageInfo"]["endCursor"]
+
+    logging.info(f"Loaded {len(login_to_email)} SAML identities for {org_name}")
+    return login_to_email
+
+_saml_emails = {}
+
+# SAML emails of an org, swept on first use and reused for every later chunk of the run
+def get_saml_emails(org_name, token):
+    if org_name not in _saml_emails:
+        _saml_emails[org_name] = fetch_saml_emails(org_name, token)
+    return _saml_emails[org_name]
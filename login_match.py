@@ -0,0 +1,161 @@
+import pandas as pd
+
+from checkpoint import RESOLVED, resume_target
+from run_metrics import METRICS
+from row_log import RowLog
+
+# Login-based matching shared by working_code.py, chatgpt_test.py and mann_lates.py: mannequin-user
+# is looked up by EMU login and the target-user is the local part of its saml_name_id plus the org suffix.
+
+
+# Function to tell a usable EMU email from a blank cell (None, NaN or whitespace)
+def has_email(email):
+    return isinstance(email, str) and email.strip() != ""
+
+# Function to build the target-user from an EMU email; None when the EMU row has no email
+def target_user_for(email, org_suffix):
+    if not has_email(email):
+        return None
+    # Extract the empirical part before the '@' and append the org suffix
+    return f"{email.strip().split('@')[0]}_{org_suffix}"
+
+# Function to word the no-match message, noting EMU rows found by login but without an email
+def no_match_message(mannequin_user, login_found):
+    if login_found:
+        return f"No match found for mannequin-user: {mannequin_user} (EMU user has no saml_name_id)"
+    return f"No match found for mannequin-user: {mannequin_user}"
+
+# Function to resolve target-user for each mapping row as it streams past
+def resolve_user_mappings(mappings, emu_users_df, org_suffix, journal=None, row_log=None, fuzzy=None, force=False):
+    row_log = row_log or RowLog(printer=print)
+    for mapping in mappings:
+        # Rows resolved earlier (already in the CSV or in the progress journal) are kept as they are
+        resumed_target = resume_target(mapping, journal, force)
+        if resumed_target:
+            mapping["target-user"] = resumed_target
+            METRICS.count("rows_resumed")
+            row_log.record("resumed")
+            yield mapping
+            continue
+
+        mannequin_user = mapping.get("mannequin-user")
+        if not mannequin_user:
+            row_log.record("skipped", f"Skipping row due to missing 'mannequin-user': {mapping}", mapping)
+            METRICS.count("rows_skipped")
+            yield mapping
+            continue
+
+        # Find the user in the Excel sheet (matching mannequin-user with login or name)
+        with METRICS.stage("matching"):
+            matched_user = emu_users_df[emu_users_df['login'] == mannequin_user]
+        METRICS.add_rows("matching", 1)
+        # Assuming email-like data is in the 'saml_name_id' field
+        target_user = None if matched_user.empty else target_user_for(matched_user.iloc[0]["saml_name_id"], org_suffix)
+        fuzzy_match = None
+        if target_user is None:
+            # A login whose EMU row has no email counts as unmatched; it must never become "nan_<org>"
+            METRICS.count("rows_unmatched")
+            # Fall back to a fuzzy match on the EMU login and display name when enabled
+            if fuzzy is not None:
+                fuzzy_match = fuzzy.match(mapping, [mannequin_user])
+            # A fuzzy candidate without an email has no target either (the matcher is built to skip them)
+            if fuzzy_match is not None and not has_email(fuzzy_match[0]["saml_name_id"]):
+                fuzzy_match = None
+            if fuzzy_match is None:
+                row_log.record("no-match", no_match_message(mannequin_user, not matched_user.empty), mapping)
+                if journal is not None:
+                    journal.record(mapping.get("mannequin-id"), "no-match")
+                yield mapping
+                continue
+            target_user = target_user_for(fuzzy_match[0]["saml_name_id"], org_suffix)
+
+        # Update the target-user column in the mapping
+        mapping["target-user"] = target_user
+        if fuzzy_match is not None:
+            fuzzy_user, confidence = fuzzy_match
+            row_log.record("fuzzy", f"Updated target-user for {mannequin_user} to {target_user} "
+                                    f"(fuzzy match on {fuzzy_user['login']}, confidence {confidence:.2f})")
+        else:
+            row_log.record("matched", f"Updated target-user for {mannequin_user} to {target_user}")
+            METRICS.count("rows_matched")
+        if journal is not None:
+            journal.record(mapping.get("mannequin-id"), RESOLVED, target_user)
+        yield mapping
+
+# Function to keep the first EMU row per login, the same row the per-row loop picks with iloc[0]
+def build_emu_lookup(emu_users_df):
+    emu_lookup = emu_users_df[["login", "saml_name_id"]].drop_duplicates(subset="login", keep="first")
+    return emu_lookup.astype(object)
+
+# Function to match one batch of mapping rows with a vectorized join against the EMU lookup
+def join_user_mappings(rows, emu_lookup, org_suffix, journal=None, row_log=None, fuzzy=None, force=False):
+    with METRICS.stage("matching"):
+        mappings_df = pd.DataFrame(rows, dtype=object)
+        if "mannequin-user" not in mappings_df.columns:
+            mappings_df["mannequin-user"] = None
+        if "target-user" not in mappings_df.columns:
+            mappings_df["target-user"] = ""
+
+        joined = mappings_df[["mannequin-user"]].merge(
+            emu_lookup, how="left", left_on="mannequin-user", right_on="login", indicator=True
+        )
+        has_user = (mappings_df["mannequin-user"].notna() & (mappings_df["mannequin-user"] != "")).to_numpy()
+
+        # Rows resolved earlier (already in the CSV or in the progress journal) are kept as they are
+        resumed_targets = pd.Series(
+            [resume_target(mapping, journal, force) for mapping in rows], index=mappings_df.index, dtype=object
+        )
+        resumed = resumed_targets.notna().to_numpy()
+        mappings_df.loc[resumed, "target-user"] = resumed_targets[resumed].to_numpy()
+        login_found = (joined["_merge"] == "both").to_numpy()
+        # A login whose EMU row has no email counts as unmatched; it must never become "nan_<org>"
+        email_found = joined["saml_name_id"].map(has_email).to_numpy(dtype=bool)
+        matched = has_user & ~resumed & login_found & email_found
+
+        # Extract the empirical part before the '@' and append the org suffix
+        empirical_part = joined["saml_name_id"].astype(object).str.strip().str.split("@").str[0]
+        target_users = empirical_part + "_" + org_suffix
+        mappings_df.loc[matched, "target-user"] = target_users[matched].to_numpy()
+
+    METRICS.add_rows("matching", len(mappings_df))
+    METRICS.count("rows_resumed", int(resumed.sum()))
+    METRICS.count("rows_skipped", int((~has_user & ~resumed).sum()))
+    METRICS.count("rows_matched", int(matched.sum()))
+    METRICS.count("rows_unmatched", int((has_user & ~resumed & ~matched).sum()))
+
+    row_log = row_log or RowLog(printer=print)
+    mappings = mappings_df.to_dict("records")
+    for mapping, row_has_user, row_resumed, row_matched, row_login_found in zip(mappings, has_user, resumed, matched, login_found):
+        mannequin_user = mapping["mannequin-user"]
+        if row_resumed:
+            row_log.record("resumed")
+        elif not row_has_user:
+            row_log.record("skipped", f"Skipping row due to missing 'mannequin-user': {mapping}", mapping)
+        elif not row_matched:
+            # Fall back to a fuzzy match on the EMU login and display name when enabled
+            fuzzy_match = fuzzy.match(mapping, [mannequin_user]) if fuzzy is not None else None
+            # A fuzzy candidate without an email has no target either (the matcher is built to skip them)
+            if fuzzy_match is not None and not has_email(fuzzy_match[0]["saml_name_id"]):
+                fuzzy_match = None
+            if fuzzy_match is None:
+                row_log.record("no-match", no_match_message(mannequin_user, row_login_found), mapping)
+                if journal is not None:
+                    journal.record(mapping.get("mannequin-id"), "no-match")
+                continue
+            fuzzy_user, confidence = fuzzy_match
+            mapping["target-user"] = target_user_for(fuzzy_user['saml_name_id'], org_suffix)
+            row_log.record("fuzzy", f"Updated target-user for {mannequin_user} to {mapping['target-user']} "
+                                    f"(fuzzy match on {fuzzy_user['login']}, confidence {confidence:.2f})")
+            if journal is not None:
+                journal.record(mapping.get("mannequin-id"), RESOLVED, mapping["target-user"])
+        else:
+            row_log.record("matched", f"Updated target-user for {mannequin_user} to {mapping['target-user']}")
+            if journal is not None:
+                journal.record(mapping.get("mannequin-id"), RESOLVED, mapping["target-user"])
+    return mappings
+
+# Function to run the vectorized join over chunks of mapping rows, yielding the updated rows
+def join_mapping_chunks(chunks, emu_users_df, org_suffix, journal=None, row_log=None, fuzzy=None, force=False):
+    emu_lookup = build_emu_lookup(emu_users_df)
+    for chunk in chunks:
+        yield from join_user_mappings(chunk, emu_lookup, org_suffix, journal, row_log, fuzzy, force)
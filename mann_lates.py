@@ -1,68 +1,105 @@
 import pandas as pd
 import os
 import csv
+from csv_stream import iter_chunks, iter_csv_rows, write_csv_atomically
+from checkpoint import open_journal
+from emu_cache import EMU_COLUMNS, load_emu_columns
+from emu_directory import is_emu_directory, load_emu_directory
+from run_metrics import METRICS
+from row_log import open_row_log
+from login_match import join_mapping_chunks, resolve_user_mappings
+from fuzzy_match import open_fuzzy_matcher
+from mapping_service import open_mapping_service
 
 # Access the environment variables
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")  # Set in GitHub Secrets
 EMU_USERS_FILE = os.getenv("EMU_USERS_FILE")  # Non-sensitive, from GitHub Variables
 USER_MAPPINGS_FILE = os.getenv("USER_MAPPINGS_FILE")  # Non-sensitive, from GitHub Variables
 ORG_NAME = os.getenv("ORG_NAME")  # Set in GitHub Secrets or Variables
+MAPPING_MODE = os.getenv("MAPPING_MODE", "loop")  # "join" matches all rows in one vectorized pass
+CSV_STREAMING = os.getenv("CSV_STREAMING", "").lower() in ("1", "true", "yes")  # Row-by-row, constant memory
+JOIN_CHUNK_SIZE = 50000  # Rows per vectorized join in streaming mode
+PROGRESS_JOURNAL = os.getenv("PROGRESS_JOURNAL")  # Append-only journal that lets a rerun resume
+EMU_CACHE_DIR = os.getenv("EMU_CACHE_DIR")  # Columnar EMU snapshots keyed by workbook hash
+FORCE_RESOLVE = os.getenv("FORCE_RESOLVE", "").lower() in ("1", "true", "yes")  # Re-resolve rows that have a target-user
+QUIET_MODE = os.getenv("QUIET_MODE", "").lower() in ("1", "true", "yes")  # Progress counters instead of per-row output
+FUZZY_MATCH = os.getenv("FUZZY_MATCH", "").lower() in ("1", "true", "yes")  # Fall back to fuzzy login/name matching
 
 # Extract base organization name (e.g., 'mgmri' from 'mgmri-dge')
 ORG_SUFFIX = ORG_NAME.split('-')[0] if ORG_NAME else ''
 
 # Function to read the Excel file
 def read_excel_file(file_name):
-    if not os.path.exists(file_name):
+    if not is_emu_directory(file_name) and not os.path.exists(file_name):
         raise FileNotFoundError(f"Excel file {file_name} not found")
     print(f"Reading Excel file: {file_name}")
-    return pd.read_excel(file_name)
+    with METRICS.stage("excel_load"):
+        if is_emu_directory(file_name):
+            emu_users_df = pd.DataFrame(load_emu_directory(file_name, EMU_CACHE_DIR))
+        elif EMU_CACHE_DIR:
+            emu_users_df = pd.DataFrame(load_emu_columns(file_name, EMU_CACHE_DIR))
+        else:
+            emu_users_df = pd.read_excel(file_name, usecols=lambda column: column in EMU_COLUMNS)
+    METRICS.add_rows("excel_load", len(emu_users_df))
+    return emu_users_df
+
+# Function to fetch only the EMU rows the mappings refer to from a running mapping service
+def read_service_users(service, user_mappings_file):
+    print(f"Looking up mannequin logins in the mapping service at {service.url}")
+    with METRICS.stage("excel_load"):
+        logins = (mapping.get("mannequin-user") for mapping in iter_csv_rows(user_mappings_file))
+        users = service.lookup_logins(logins).values()
+        emu_users_df = pd.DataFrame([[user[column] for column in EMU_COLUMNS] for user in users], columns=list(EMU_COLUMNS))
+    METRICS.add_rows("excel_load", len(emu_users_df))
+    return emu_users_df
 
 # Function to read the user mappings CSV file
 def read_csv_file(file_name):
     if not os.path.exists(file_name):
         raise FileNotFoundError(f"CSV file {file_name} not found")
     print(f"Reading CSV file: {file_name}")
-    with open(file_name, mode='r', newline='', encoding='utf-8') as file:
-        return list(csv.DictReader(file))
+    with METRICS.stage("csv_read"), open(file_name, mode='r', newline='', encoding='utf-8') as file:
+        mappings = list(csv.DictReader(file))
+    METRICS.add_rows("csv_read", len(mappings))
+    return mappings
+
+# Function to stream the user mappings CSV file row by row
+def stream_csv_file(file_name):
+    if not os.path.exists(file_name):
+        raise FileNotFoundError(f"CSV file {file_name} not found")
+    print(f"Streaming CSV file: {file_name}")
+    return iter_csv_rows(file_name)
 
 # Function to update target-user column in the CSV file
 def update_csv_file(file_name, mappings):
     print(f"Writing updates back to the CSV file: {file_name}")
-    with open(file_name, mode='w', newline='', encoding='utf-8') as file:
-        fieldnames = ["mannequin-user", "mannequin-id", "target-user"]
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(mappings)
+    # Write to a temp file and rename it over the original so a crash never leaves a half-written CSV
+    write_csv_atomically(file_name, mappings, ["mannequin-user", "mannequin-id", "target-user"])
     print("CSV file updated successfully.")
 
 # Function to process user mappings
-def process_user_mappings(user_mappings_file, emu_users_df, org_suffix):
+def process_user_mappings(user_mappings_file, emu_users_df, org_suffix, journal=None, row_log=None, fuzzy=None):
     print("Processing user mappings...")
-    mappings = read_csv_file(user_mappings_file)
 
-    for mapping in mappings:
-        mannequin_user = mapping.get("mannequin-user")
-        if not mannequin_user:
-            print(f"Skipping row due to missing 'mannequin-user': {mapping}")
-            continue
+    # In streaming mode rows are read, resolved and written one at a time
+    if CSV_STREAMING:
+        mappings = resolve_user_mappings(stream_csv_file(user_mappings_file), emu_users_df, org_suffix, journal, row_log, fuzzy, FORCE_RESOLVE)
+    else:
+        mappings = list(resolve_user_mappings(read_csv_file(user_mappings_file), emu_users_df, org_suffix, journal, row_log, fuzzy, FORCE_RESOLVE))
 
-        # Find the user in the Excel sheet (matching mannequin-user with login or name)
-        matched_user = emu_users_df[emu_users_df['login'] == mannequin_user]
-        if matched_user.empty:
-            print(f"No match found for mannequin-user: {mannequin_user}")
-            continue
-
-        # Assuming email-like data is in the 'saml_name_id' field
-        email = matched_user.iloc[0]["saml_name_id"]
+    # Update the CSV file with the new target-user values
+    update_csv_file(user_mappings_file, mappings)
 
-        # Extract the empirical part before the '@' and append '_ORG_SUFFIX'
-        empirical_part = email.split('@')[0]
-        target_user = f"{empirical_part}_{org_suffix}"
+# Function to process user mappings with one vectorized join against the EMU sheet
+def process_user_mappings_join(user_mappings_file, emu_users_df, org_suffix, journal=None, row_log=None, fuzzy=None):
+    print("Processing user mappings (join mode)")
 
-        # Update the target-user column in the mapping
-        mapping["target-user"] = target_user
-        print(f"Updated target-user for {mannequin_user} to {target_user}")
+    # In streaming mode the join runs over fixed-size chunks so memory stays flat
+    if CSV_STREAMING:
+        chunks = iter_chunks(stream_csv_file(user_mappings_file), JOIN_CHUNK_SIZE)
+    else:
+        chunks = [read_csv_file(user_mappings_file)]
+    mappings = join_mapping_chunks(chunks, emu_users_df, org_suffix, journal, row_log, fuzzy, FORCE_RESOLVE)
 
     # Update the CSV file with the new target-user values
     update_csv_file(user_mappings_file, mappings)
@@ -70,11 +107,16 @@ def process_user_mappings(user_mappings_file, emu_users_df, org_suffix):
 # Main function to execute the process
 def main():
     print("Executing migration script...")
-    if not (GITHUB_TOKEN and EMU_USERS_FILE and USER_MAPPINGS_FILE and ORG_NAME):
+    # Fuzzy matching scans the whole EMU directory, so it always loads the workbook itself
+    service = None if FUZZY_MATCH else open_mapping_service()
+    if not (GITHUB_TOKEN and (EMU_USERS_FILE or service) and USER_MAPPINGS_FILE and ORG_NAME):
         raise ValueError("Missing required environment variables. Ensure they are set correctly.")
 
-    # Load the EMU users Excel file
-    emu_users_df = read_excel_file(EMU_USERS_FILE)
+    # Load the EMU users Excel file, or just the users the mappings need from the mapping service
+    if service is not None:
+        emu_users_df = read_service_users(service, USER_MAPPINGS_FILE)
+    else:
+        emu_users_df = read_excel_file(EMU_USERS_FILE)
 
     # Check if the required columns are present in the Excel file
     required_columns = {'login', 'name', 'saml_name_id'}
@@ -82,7 +124,23 @@ def main():
         raise ValueError(f"Excel file must contain the following columns: {required_columns}")
 
     # Process user mappings and update the CSV file
-    process_user_mappings(USER_MAPPINGS_FILE, emu_users_df, ORG_SUFFIX)
+    journal = open_journal(PROGRESS_JOURNAL)
+    row_log = open_row_log(USER_MAPPINGS_FILE, QUIET_MODE, printer=print)
+    fuzzy = None
+    if FUZZY_MATCH:
+        fuzzy = open_fuzzy_matcher(emu_users_df[["login", "name", "saml_name_id"]].to_dict("records"), USER_MAPPINGS_FILE, require_email=True)
+    try:
+        if MAPPING_MODE == "join":
+            process_user_mappings_join(USER_MAPPINGS_FILE, emu_users_df, ORG_SUFFIX, journal, row_log, fuzzy)
+        else:
+            process_user_mappings(USER_MAPPINGS_FILE, emu_users_df, ORG_SUFFIX, journal, row_log, fuzzy)
+    finally:
+        row_log.close()
+        if fuzzy is not None:
+            fuzzy.close()
+        if journal is not None:
+            journal.close()
+        METRICS.write_report()
 
 if __name__ == "__main__":
     main()
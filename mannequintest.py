@@ -1,23 +1,46 @@
 import os
 import csv
 import logging
-import requests
-from openpyxl import load_workbook
+import sys
+from github_client import get_client
 from dotenv import load_dotenv
+from async_resolver import parse_concurrency, resolve_concurrently
+from csv_stream import STREAM_CHUNK_SIZE, iter_chunks, iter_csv_rows, write_csv_atomically
+from checkpoint import RESOLVED, open_journal, resume_target
+from emu_cache import columns_to_records
+from emu_directory import load_emu_sources
+from graphql_lookup import fetch_user_emails_batch, get_saml_emails
+from user_cache import open_user_cache
+from emu_index import build_email_index, lookup_email, normalize_email, parse_alias_domains
+from run_metrics import METRICS
+from row_log import RowLog, open_row_log, setup_logging
+from fuzzy_match import open_fuzzy_matcher
+from mapping_service import MAPPING_SERVICE_URL, RemoteEmailIndex, open_mapping_service
 
 # Load environment variables
 load_dotenv()
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Set up logging (queued to a background thread in quiet mode)
+QUIET_MODE = os.getenv('QUIET_MODE', '').lower() in ('1', 'true', 'yes')  # Progress counters instead of per-row output
+setup_logging(QUIET_MODE)
 
 # Environment variables
 GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
 ORG_NAME = os.getenv('ORG_NAME')
 GHEC_CSV = os.getenv('GHEC_CSV')
 EMU_EXCEL = os.getenv('EMU_EXCEL')
+EMAIL_ALIAS_DOMAINS = parse_alias_domains(os.getenv('EMAIL_ALIAS_DOMAINS'))
+RESOLVE_CONCURRENCY = parse_concurrency(os.getenv('RESOLVE_CONCURRENCY'))
+EMAIL_RESOLVER = os.getenv('EMAIL_RESOLVER', 'rest')  # 'graphql' batches 100 logins per request, 'saml' sweeps SAML identities
+SAML_ORG = os.getenv('SAML_ORG') or ORG_NAME  # Org whose SAML identities link mannequin logins to emails
+USER_CACHE = open_user_cache(os.getenv('USER_CACHE_PATH'), os.getenv('USER_CACHE_TTL'), GITHUB_TOKEN)
+CSV_STREAMING = os.getenv('CSV_STREAMING', '').lower() in ('1', 'true', 'yes')  # Row-by-row, constant memory
+PROGRESS_JOURNAL = os.getenv('PROGRESS_JOURNAL')  # Append-only journal that lets a rerun resume
+EMU_CACHE_DIR = os.getenv('EMU_CACHE_DIR')  # Columnar EMU snapshots keyed by workbook hash
+FORCE_RESOLVE = os.getenv('FORCE_RESOLVE', '').lower() in ('1', 'true', 'yes')  # Re-resolve rows that have a target-user
+FUZZY_MATCH = os.getenv('FUZZY_MATCH', '').lower() in ('1', 'true', 'yes')  # Fall back to fuzzy login/name matching
 
-GITHUB_API_URL = "https://api.github.com"
+GITHUB_API_URL = os.getenv('GITHUB_API_URL', "https://api.github.com")
 
 def fetch_org_members(org_name, token):
     url = f"{GITHUB_API_URL}/orgs/{org_name}/members"
@@ -25,12 +48,22 @@ def fetch_org_members(org_name, token):
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json"
     }
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        logging.error(f"Error fetching org members: {response.status_code}")
-        return []
+    params = {"per_page": 100}
+    # Yield members page by page, following the Link rel="next" header
+    while url:
+        with METRICS.stage("member_fetch"):
+            if USER_CACHE is not None:
+                response = USER_CACHE.get_page(url, headers, params)
+            else:
+                response = get_client(token).get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            logging.error(f"Error fetching org members: {response.status_code}")
+            return
+        members = response.json()
+        METRICS.add_rows("member_fetch", len(members))
+        yield from members
+        url = response.links.get("next", {}).get("url")
+        params = None  # The next link already carries per_page and page
 
 def fetch_user_email(username, token):
     url = f"{GITHUB_API_URL}/users/{username}"
@@ -38,7 +71,10 @@ def fetch_user_email(username, token):
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json"
     }
-    response = requests.get(url, headers=headers)
+    if USER_CACHE is not None:
+        response = USER_CACHE.get_user(username, url, headers)
+    else:
+        response = get_client(token).get(url, headers=headers)
     if response.status_code == 200:
         user_data = response.json()
         return user_data.get("email")
@@ -47,58 +83,148 @@ def fetch_user_email(username, token):
         return None
 
 def read_ghec_csv(file_path):
-    with open(file_path, 'r') as file:
+    with METRICS.stage("csv_read"), open(file_path, 'r') as file:
         reader = csv.DictReader(file)
-        return list(reader)
+        rows = list(reader)
+    METRICS.add_rows("csv_read", len(rows))
+    return rows
 
 def read_emu_excel(file_path):
-    wb = load_workbook(filename=file_path, read_only=True)
-    sheet = wb.active
-    headers = [cell.value for cell in sheet[1]]
-    emu_users = []
-    for row in sheet.iter_rows(min_row=2, values_only=True):
-        emu_users.append(dict(zip(headers, row)))
+    with METRICS.stage("excel_load"):
+        # Only the matcher columns are read, into slotted records (snapshot-cached when EMU_CACHE_DIR is set).
+        # EMU_EXCEL may also list several workbooks, directories or "workbook.xlsx#Sheet" entries.
+        emu_users = columns_to_records(load_emu_sources(file_path, EMU_CACHE_DIR))
+    METRICS.add_rows("excel_load", len(emu_users))
     return emu_users
 
-def process_mannequins(ghec_csv, emu_users):
-    ghec_data = read_ghec_csv(ghec_csv)
-    updated_data = []
-
-    for mannequin in ghec_data:
-        mannequin_username = mannequin['mannequin-user']
-        mannequin_id = mannequin['mannequin-id']
-        
-        email = fetch_user_email(mannequin_username, GITHUB_TOKEN)
-        if email:
-            target_user = next((user for user in emu_users if user['saml_name_id'] == email), None)
+# Resolve target users chunk by chunk so batched and concurrent lookups work on a stream of rows
+def resolve_mannequins(rows, emu_index, journal=None, row_log=None, fuzzy=None):
+    row_log = row_log or RowLog()
+    for chunk in iter_chunks(rows, STREAM_CHUNK_SIZE):
+        # Rows resolved earlier (already in the CSV or in the progress journal) skip the API entirely
+        pending = []
+        for mannequin in chunk:
+            resumed_target = resume_target(mannequin, journal, FORCE_RESOLVE)
+            if resumed_target:
+                mannequin['target-user'] = resumed_target
+                METRICS.count("rows_resumed")
+                row_log.record("resumed")
+            else:
+                pending.append(mannequin)
+
+        # Resolve the chunk's emails up front when batched or concurrent resolution is enabled
+        usernames = [mannequin['mannequin-user'] for mannequin in pending]
+        emails = None
+        with METRICS.stage("email_resolution"):
+            if EMAIL_RESOLVER == 'graphql':
+                email_map = fetch_user_emails_batch(usernames, GITHUB_TOKEN)
+                emails = [email_map.get(username) for username in usernames]
+            elif EMAIL_RESOLVER == 'saml':
+                # One paged sweep of the org's SAML identities serves every chunk
+                saml_emails = get_saml_emails(SAML_ORG, GITHUB_TOKEN)
+                emails = [saml_emails.get(username.casefold()) for username in usernames]
+            elif RESOLVE_CONCURRENCY > 1:
+                emails = resolve_concurrently(
+                    usernames,
+                    lambda username: fetch_user_email(username, GITHUB_TOKEN),
+                    RESOLVE_CONCURRENCY,
+                )
+        METRICS.add_rows("email_resolution", len(usernames))
+
+        # A mapping service answers the whole chunk's email lookups in one request
+        if emails is not None and isinstance(emu_index, RemoteEmailIndex):
+            with METRICS.stage("matching"):
+                emu_index.prefetch([normalize_email(email, EMAIL_ALIAS_DOMAINS) for email in emails])
+
+        for index, mannequin in enumerate(pending):
+            mannequin_username = mannequin['mannequin-user']
+            mannequin_id = mannequin['mannequin-id']
+
+            if emails is not None:
+                email = emails[index]
+            else:
+                with METRICS.stage("email_resolution"):
+                    email = fetch_user_email(mannequin_username, GITHUB_TOKEN)
+            target_user = None
+            if email:
+                with METRICS.stage("matching"):
+                    target_user = lookup_email(emu_index, email, EMAIL_ALIAS_DOMAINS)
+                METRICS.add_rows("matching", 1)
+                METRICS.count("rows_matched" if target_user else "rows_unmatched")
+            else:
+                METRICS.count("emails_missing")
+
+            # Fall back to a fuzzy match of the login (and email local part) on EMU login and display name
+            fuzzy_match = None
+            if not target_user and fuzzy is not None:
+                queries = [mannequin_username] + ([email.split('@')[0]] if email else [])
+                fuzzy_match = fuzzy.match(mannequin, queries)
+                if fuzzy_match is not None:
+                    target_user = fuzzy_match[0]
+
             if target_user:
                 mannequin['target-user'] = target_user['login']
-                logging.info(f"Found target user: {target_user['login']} for mannequin: {mannequin_username}")
+                if fuzzy_match is not None:
+                    row_log.record("fuzzy", f"Found target user: {target_user['login']} for mannequin: {mannequin_username} "
+                                            f"(fuzzy match, confidence {fuzzy_match[1]:.2f})")
+                else:
+                    row_log.record("matched", f"Found target user: {target_user['login']} for mannequin: {mannequin_username}")
+                status = RESOLVED
+            elif email:
+                row_log.record("no-match", f"No target user found for mannequin: {mannequin_username}", mannequin, logging.WARNING)
+                status = "no-match"
             else:
-                logging.warning(f"No target user found for mannequin: {mannequin_username}")
-        else:
-            logging.warning(f"No email found for mannequin: {mannequin_username}")
-        
-        updated_data.append(mannequin)
-
-    # Write updated data back to CSV
-    with open(ghec_csv, 'w', newline='') as file:
-        fieldnames = ['mannequin-user', 'mannequin-id', 'target-user']
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(updated_data)
+                row_log.record("no-email", f"No email found for mannequin: {mannequin_username}", mannequin, logging.WARNING)
+                status = "no-email"
+
+            if journal is not None:
+                journal.record(mannequin_id, status, mannequin.get('target-user') or "")
+
+        yield from chunk
+
+# With a mapping service client, emails are matched against its warm index and emu_users is unused
+def process_mannequins(ghec_csv, emu_users, journal=None, row_log=None, fuzzy=None, service=None):
+    if service is not None:
+        emu_index = RemoteEmailIndex(service)
+    else:
+        emu_index = build_email_index(emu_users, EMAIL_ALIAS_DOMAINS)
+
+    # In streaming mode rows are read, resolved and written without holding the whole file
+    if CSV_STREAMING:
+        updated_data = resolve_mannequins(iter_csv_rows(ghec_csv), emu_index, journal, row_log, fuzzy)
+    else:
+        updated_data = list(resolve_mannequins(read_ghec_csv(ghec_csv), emu_index, journal, row_log, fuzzy))
+
+    # Write updated data to a temp file and atomically replace the CSV
+    fieldnames = ['mannequin-user', 'mannequin-id', 'target-user']
+    write_csv_atomically(ghec_csv, updated_data, fieldnames)
 
 def main():
-    if not all([GITHUB_TOKEN, ORG_NAME, GHEC_CSV, EMU_EXCEL]):
+    if not all([GITHUB_TOKEN, ORG_NAME, GHEC_CSV, EMU_EXCEL or MAPPING_SERVICE_URL]):
         logging.error("Missing required environment variables. Please check your .env file.")
-        return
+        return 1
 
     try:
-        emu_users = read_emu_excel(EMU_EXCEL)
-        process_mannequins(GHEC_CSV, emu_users)
+        # Fuzzy matching scans the whole EMU directory, so it always loads the workbook itself
+        service = None if FUZZY_MATCH else open_mapping_service()
+        emu_users = read_emu_excel(EMU_EXCEL) if service is None else None
+        journal = open_journal(PROGRESS_JOURNAL)
+        row_log = open_row_log(GHEC_CSV, QUIET_MODE)
+        fuzzy = open_fuzzy_matcher(emu_users, GHEC_CSV) if FUZZY_MATCH else None
+        try:
+            process_mannequins(GHEC_CSV, emu_users, journal, row_log, fuzzy, service)
+        finally:
+            row_log.close()
+            if fuzzy is not None:
+                fuzzy.close()
+            if journal is not None:
+                journal.close()
         logging.info("CSV file updated with target users.")
+        METRICS.write_report()
+        return 0
     except Exception as e:
         logging.error(f"An error occurred: {str(e)}")
+        return 1
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
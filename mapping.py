@@ -0,0 +1,334 @@
+import argparse
+import csv
+import importlib
+import importlib.util
+import os
+import sys
+
+# Single entry point for the mannequin mapping flows. Only the standard library is imported up
+# front; each subcommand imports the strategy it runs, so validate and dry-run start without
+# loading pandas or requests.
+
+STRATEGIES = ("login", "email", "members")
+MAPPING_COLUMNS = ("mannequin-user", "mannequin-id")
+EMU_COLUMNS_BY_STRATEGY = {
+    "login": ("login", "name", "saml_name_id"),
+    "email": ("login", "saml_name_id"),
+    "members": (),
+}
+
+
+# Load a .env file when python-dotenv is installed, like the individual scripts do
+def load_env_file():
+    try:
+        from dotenv import load_dotenv
+    except ImportError:
+        return
+    load_dotenv()
+
+# Export a command-line value under the environment variable the strategy scripts read
+def set_env(name, value):
+    if value is not None:
+        os.environ[name] = str(value)
+
+def set_flag(name, enabled):
+    if enabled:
+        os.environ[name] = "1"
+
+# Function to run the login-based mapping (mann_lates.py)
+def run_login(args):
+    set_env("EMU_USERS_FILE", args.emu_users_file)
+    set_env("USER_MAPPINGS_FILE", args.user_mappings_file)
+    set_env("ORG_NAME", args.org_name)
+    set_env("MAPPING_MODE", args.mode)
+    set_flag("QUIET_MODE", args.quiet)
+    set_flag("FUZZY_MATCH", args.fuzzy)
+    set_env("MAPPING_SERVICE_URL", args.service_url)
+    return importlib.import_module("mann_lates").main()
+
+# Function to run the email-based mapping (mannequintest.py)
+def run_email(args):
+    set_env("EMU_EXCEL", args.emu_users_file or os.getenv("EMU_USERS_FILE"))
+    set_env("GHEC_CSV", args.user_mappings_file or os.getenv("USER_MAPPINGS_FILE"))
+    set_env("ORG_NAME", args.org_name)
+    set_env("EMAIL_RESOLVER", args.resolver)
+    set_env("SAML_ORG", args.saml_org)
+    set_env("RESOLVE_CONCURRENCY", args.concurrency)
+    set_flag("QUIET_MODE", args.quiet)
+    set_flag("FUZZY_MATCH", args.fuzzy)
+    set_env("MAPPING_SERVICE_URL", args.service_url)
+    return importlib.import_module("mannequintest").main()
+
+# Function to run the org-member-based mapping (target-user.py)
+def run_members(args):
+    set_env("USER_MAPPINGS_FILE", args.user_mappings_file)
+    set_env("ORG_NAME", args.org_name)
+    set_env("EMAIL_RESOLVER", args.resolver)
+    set_env("SAML_ORG", args.saml_org)
+    set_env("RESOLVE_CONCURRENCY", args.concurrency)
+    set_env("MEMBER_SNAPSHOT_PATH", args.snapshot)
+    set_flag("QUIET_MODE", args.quiet)
+    return importlib.import_module("target-user").main()
+
+# Function to submit the reclaims for a resolved mappings CSV (reclaim.py)
+def run_reclaim(args):
+    set_env("USER_MAPPINGS_FILE", args.user_mappings_file)
+    set_env("ORG_NAME", args.org_name)
+    set_env("RECLAIM_CONCURRENCY", args.concurrency)
+    set_env("RECLAIM_RESULTS_CSV", args.results)
+    set_flag("RECLAIM_SKIP_INVITATION", args.skip_invitation)
+    set_flag("QUIET_MODE", args.quiet)
+    return importlib.import_module("reclaim").main()
+
+# Function to run the resident mapping service (mapping_service.py) over the EMU export
+def run_serve(args):
+    from emu_index import parse_alias_domains
+    from mapping_service import MAPPING_SERVICE_HOST, MAPPING_SERVICE_PORT, serve
+    from row_log import setup_logging
+
+    emu_users_file = args.emu_users_file or os.getenv("EMU_USERS_FILE")
+    if not emu_users_file:
+        print("Error: --emu-users-file (or EMU_USERS_FILE) is required")
+        return 1
+    setup_logging()
+    serve(emu_users_file, args.host or MAPPING_SERVICE_HOST, args.port or MAPPING_SERVICE_PORT,
+          os.getenv("EMU_CACHE_DIR"), parse_alias_domains(os.getenv("EMAIL_ALIAS_DOMAINS")))
+    return 0
+
+# Function to check every sheet of an EMU source list; sheets without a login column are skipped at load time
+def validate_emu_directory(spec, emu_columns, warnings):
+    from emu_cache import read_workbook_header
+    from emu_directory import expand_emu_sources
+
+    try:
+        units = expand_emu_sources(spec)
+    except (OSError, ValueError) as e:
+        return [f"EMU sources {spec}: {e}"]
+    errors, usable = [], 0
+    for workbook, sheet_name in units:
+        header = read_workbook_header(workbook, sheet_name)
+        if "login" not in header:
+            warnings.append(f"Sheet {sheet_name} of {workbook} has no 'login' column and will be skipped")
+            continue
+        usable += 1
+        missing = [column for column in emu_columns if column not in header]
+        if missing:
+            errors.append(f"Sheet {sheet_name} of {workbook} is missing columns: {', '.join(missing)}")
+    if not usable:
+        errors.append(f"No sheet in {spec} has a 'login' column")
+    print(f"EMU sources: {len(units)} sheets, {usable} with users")
+    return errors
+
+# Function to check the GitHub App settings of the token pool, when an app is configured
+def check_app_credentials():
+    if not os.getenv("GITHUB_APP_ID"):
+        return []
+    errors = []
+    if not os.getenv("GITHUB_APP_PRIVATE_KEY"):
+        errors.append("GITHUB_APP_ID is set but GITHUB_APP_PRIVATE_KEY is not")
+    if not os.getenv("GITHUB_APP_INSTALLATION_IDS", "").strip(", "):
+        errors.append("GITHUB_APP_ID is set but GITHUB_APP_INSTALLATION_IDS is not")
+    if importlib.util.find_spec("jwt") is None:
+        errors.append("GitHub App credentials need PyJWT: pip install 'pyjwt[crypto]'")
+    return errors
+
+# Function to check the inputs of a strategy before any network call or write
+def validate(args):
+    strategy = args.strategy
+    emu_users_file = args.emu_users_file or os.getenv("EMU_USERS_FILE")
+    user_mappings_file = args.user_mappings_file or os.getenv("USER_MAPPINGS_FILE")
+    errors, warnings = [], []
+
+    if not (os.getenv("GITHUB_TOKEN") or os.getenv("GITHUB_TOKENS") or os.getenv("GITHUB_APP_ID")):
+        errors.append("GITHUB_TOKEN is not set (or GITHUB_TOKENS / GITHUB_APP_ID for a token pool)")
+    errors.extend(check_app_credentials())
+    if not (args.org_name or os.getenv("ORG_NAME")):
+        errors.append("Organization name is not set (--org-name or ORG_NAME)")
+
+    emu_columns = EMU_COLUMNS_BY_STRATEGY[strategy]
+    if emu_columns:
+        from emu_directory import is_emu_directory
+
+        if not emu_users_file:
+            errors.append("EMU users file is not set (--emu-users-file or EMU_USERS_FILE)")
+        elif is_emu_directory(emu_users_file):
+            errors.extend(validate_emu_directory(emu_users_file, emu_columns, warnings))
+        elif not os.path.exists(emu_users_file):
+            errors.append(f"EMU users file {emu_users_file} not found")
+        else:
+            from emu_cache import read_workbook_header
+
+            header = read_workbook_header(emu_users_file)
+            missing = [column for column in emu_columns if column not in header]
+            if missing:
+                errors.append(f"EMU users file {emu_users_file} is missing columns: {', '.join(missing)}")
+
+    if not user_mappings_file:
+        errors.append("User mappings file is not set (--user-mappings-file or USER_MAPPINGS_FILE)")
+    elif not os.path.exists(user_mappings_file):
+        errors.append(f"User mappings file {user_mappings_file} not found")
+    else:
+        with open(user_mappings_file, mode='r', newline='', encoding='utf-8') as file:
+            reader = csv.DictReader(file)
+            missing = [column for column in MAPPING_COLUMNS if column not in (reader.fieldnames or [])]
+            if missing:
+                errors.append(f"User mappings file {user_mappings_file} is missing columns: {', '.join(missing)}")
+            else:
+                rows = blank_users = resolved = 0
+                for row in reader:
+                    rows += 1
+                    blank_users += not (row.get("mannequin-user") or "").strip()
+                    resolved += bool((row.get("target-user") or "").strip())
+                print(f"User mappings file: {rows} rows, {resolved} already have a target-user")
+                if blank_users:
+                    warnings.append(f"{blank_users} rows have no mannequin-user and will be skipped")
+
+    # The inputs are readable; scan their contents for duplicates and collisions before any network call
+    if not errors and not args.skip_conflicts:
+        errors.extend(check_conflicts(strategy, emu_users_file if emu_columns else None, user_mappings_file,
+                                      args.org_name or os.getenv("ORG_NAME") or "", warnings))
+
+    for warning in warnings:
+        print(f"Warning: {warning}")
+    for error in errors:
+        print(f"Error: {error}")
+    if errors:
+        return 1
+    print(f"Inputs are valid for the {strategy} strategy.")
+    return 0
+
+# Function to run the one-pass duplicate and collision scan over the mappings and the EMU export
+def check_conflicts(strategy, emu_users_file, user_mappings_file, org_name, warnings):
+    from conflict_check import conflicts_path, find_conflicts, write_conflicts
+    from csv_stream import iter_csv_rows
+
+    emu_data = None
+    if emu_users_file:
+        from emu_cache import EMU_COLUMNS
+        from emu_directory import load_emu_sources
+
+        # Same columns as the mapping flows, so with EMU_CACHE_DIR their run reuses this parse
+        emu_data = load_emu_sources(emu_users_file, os.getenv("EMU_CACHE_DIR"), EMU_COLUMNS)
+    # Only the login flow's targets can be predicted offline; the others are checked as already written
+    org_suffix = org_name.split('-')[0] if strategy == "login" else None
+    findings = find_conflicts(iter_csv_rows(user_mappings_file), emu_data, org_suffix)
+    if not findings:
+        print("No duplicate ids, ambiguous EMU rows or target collisions found")
+        return []
+
+    report_path = conflicts_path(user_mappings_file)
+    write_conflicts(report_path, findings)
+    counts = {}
+    for finding in findings:
+        key = (finding["severity"], finding["kind"])
+        counts[key] = counts.get(key, 0) + 1
+    errors = []
+    for (severity, kind), count in counts.items():
+        example = next(finding for finding in findings if finding["kind"] == kind and finding["severity"] == severity)
+        message = f"{count} {kind} findings (e.g. {example['value']}: {example['details']}); see {report_path}"
+        (errors if severity == "error" else warnings).append(message)
+    return errors
+
+# Function to preview the login-based mapping offline, without calling GitHub or writing the CSV
+def dry_run(args):
+    from checkpoint import resume_target
+    from csv_stream import iter_csv_rows
+    from emu_directory import load_emu_sources
+
+    emu_users_file = args.emu_users_file or os.getenv("EMU_USERS_FILE")
+    user_mappings_file = args.user_mappings_file or os.getenv("USER_MAPPINGS_FILE")
+    org_name = args.org_name or os.getenv("ORG_NAME") or ""
+    org_suffix = org_name.split('-')[0]
+    if not (emu_users_file and user_mappings_file):
+        print("Error: --emu-users-file and --user-mappings-file (or their environment variables) are required")
+        return 1
+
+    # First EMU row per login wins, as in the login flow; a first row without an email is a no-match there too
+    data = load_emu_sources(emu_users_file, os.getenv("EMU_CACHE_DIR"), ("login", "saml_name_id"))
+    emails_by_login = {}
+    for login, email in zip(data.get("login", []), data.get("saml_name_id", [])):
+        if login is not None:
+            emails_by_login.setdefault(login, email.strip() if isinstance(email, str) else None)
+
+    outcomes = {"matched": 0, "resumed": 0, "no-match": 0, "skipped": 0}
+    shown = 0
+    for mapping in iter_csv_rows(user_mappings_file):
+        mannequin_user = mapping.get("mannequin-user")
+        if resume_target(mapping, force=args.force):
+            outcomes["resumed"] += 1
+        elif not mannequin_user:
+            outcomes["skipped"] += 1
+        elif not emails_by_login.get(mannequin_user):
+            outcomes["no-match"] += 1
+        else:
+            outcomes["matched"] += 1
+            if shown < args.show:
+                print(f"Would set target-user for {mannequin_user} to {emails_by_login[mannequin_user].split('@')[0]}_{org_suffix}")
+                shown += 1
+
+    print("Dry run: " + ", ".join(f"{outcome} {count}" for outcome, count in outcomes.items()))
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="mapping.py", description="Map mannequins to EMU users for reclamation.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    inputs = argparse.ArgumentParser(add_help=False)
+    inputs.add_argument("--org-name", help="GitHub organization (default: ORG_NAME)")
+    inputs.add_argument("--user-mappings-file", help="Mannequin mappings CSV (default: USER_MAPPINGS_FILE)")
+
+    emu = argparse.ArgumentParser(add_help=False)
+    emu.add_argument("--emu-users-file", help="EMU users workbook (default: EMU_USERS_FILE)")
+
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--quiet", action="store_true", help="Progress counters instead of per-row output")
+
+    lookups = argparse.ArgumentParser(add_help=False)
+    lookups.add_argument("--resolver", choices=("rest", "graphql", "saml"), help="Email lookup API (default: EMAIL_RESOLVER)")
+    lookups.add_argument("--saml-org", help="Org whose SAML identities the saml resolver sweeps (default: SAML_ORG or the org name)")
+    lookups.add_argument("--concurrency", type=int, help="Parallel REST lookups (default: RESOLVE_CONCURRENCY)")
+
+    login = subparsers.add_parser("login", parents=[inputs, emu, output], help="Match mannequin logins against the EMU export")
+    login.add_argument("--mode", choices=("loop", "join"), help="Per-row loop or vectorized join (default: MAPPING_MODE)")
+    login.add_argument("--fuzzy", action="store_true", help="Fall back to fuzzy login/name matching")
+    login.add_argument("--service-url", help="Look users up in a running mapping service (default: MAPPING_SERVICE_URL)")
+    login.set_defaults(handler=run_login)
+
+    email = subparsers.add_parser("email", parents=[inputs, emu, output, lookups], help="Match mannequin profile emails against the EMU export")
+    email.add_argument("--fuzzy", action="store_true", help="Fall back to fuzzy login/name matching")
+    email.add_argument("--service-url", help="Look users up in a running mapping service (default: MAPPING_SERVICE_URL)")
+    email.set_defaults(handler=run_email)
+
+    members = subparsers.add_parser("members", parents=[inputs, output, lookups], help="Match mannequins against current org members")
+    members.add_argument("--snapshot", help="SQLite member snapshot for incremental syncs (default: MEMBER_SNAPSHOT_PATH)")
+    members.set_defaults(handler=run_members)
+
+    reclaim = subparsers.add_parser("reclaim", parents=[inputs, output], help="Reclaim mannequins listed in a resolved mappings CSV")
+    reclaim.add_argument("--concurrency", type=int, help="Reclaim mutations in flight (default: RECLAIM_CONCURRENCY or 8)")
+    reclaim.add_argument("--results", help="Per-row results CSV (default: RECLAIM_RESULTS_CSV or <mappings>.reclaim.csv)")
+    reclaim.add_argument("--skip-invitation", action="store_true", help="Reattribute directly instead of inviting (EMU orgs)")
+    reclaim.set_defaults(handler=run_reclaim)
+
+    service = subparsers.add_parser("serve", parents=[emu], help="Keep the EMU indexes in memory and answer lookups over HTTP")
+    service.add_argument("--host", help="Listen address (default: MAPPING_SERVICE_HOST or 127.0.0.1)")
+    service.add_argument("--port", type=int, help="Listen port (default: MAPPING_SERVICE_PORT or 8787)")
+    service.set_defaults(handler=run_serve)
+
+    check = subparsers.add_parser("validate", parents=[inputs, emu], help="Check inputs and configuration without calling GitHub")
+    check.add_argument("--strategy", choices=STRATEGIES, default="login", help="Strategy whose inputs to check")
+    check.add_argument("--skip-conflicts", action="store_true", help="Only check files and columns, not duplicates and collisions")
+    check.set_defaults(handler=validate)
+
+    preview = subparsers.add_parser("dry-run", parents=[inputs, emu], help="Preview login matches without calling GitHub or writing")
+    preview.add_argument("--show", type=int, default=10, help="Number of proposed changes to print")
+    preview.add_argument("--force", action="store_true", help="Count rows that already have a target-user as pending")
+    preview.set_defaults(handler=dry_run)
+    return parser
+
+def main(argv=None):
+    load_env_file()
+    args = build_parser().parse_args(argv)
+    return args.handler(args) or 0
+
+if __name__ == "__main__":
+    sys.exit(main())
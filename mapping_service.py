@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from emu_cache import EMU_COLUMNS, EmuUser, columns_to_records
+from emu_directory import expand_emu_sources, is_emu_directory, load_emu_sources
+from emu_index import build_email_index, normalize_email, parse_alias_domains
+
+MAPPING_SERVICE_URL = os.getenv("MAPPING_SERVICE_URL")  # e.g. http://127.0.0.1:8787; unset runs the flows standalone
+MAPPING_SERVICE_HOST = os.getenv("MAPPING_SERVICE_HOST", "127.0.0.1")
+MAPPING_SERVICE_PORT = int(os.getenv("MAPPING_SERVICE_PORT") or 8787)
+RELOAD_CHECK_INTERVAL = 2.0  # Seconds between checks of the EMU workbooks' modification times
+LOOKUP_BATCH_SIZE = 10000  # Keys sent per lookup request by the client
+
+
+# EMU directory held in memory with its login and email indexes. Lookups check (at most every
+# RELOAD_CHECK_INTERVAL seconds) whether a source workbook changed and rebuild the indexes if so;
+# requests arriving during a rebuild keep answering from the previous indexes.
+class WarmIndex:
+    def __init__(self, spec, cache_dir=None, alias_domains=None):
+        self.spec = spec
+        self.cache_dir = cache_dir
+        self.alias_domains = alias_domains
+        self._reload_lock = threading.Lock()
+        self._checked_at = 0.0
+        self._signature = None
+        self._state = None
+        self.reload()
+
+    # (path, mtime, size) of every workbook behind the spec
+    def _source_signature(self):
+        if is_emu_directory(self.spec):
+            paths = sorted({workbook for workbook, _ in expand_emu_sources(self.spec)})
+        else:
+            paths = [self.spec]
+        signature = []
+        for path in paths:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def reload(self):
+        with self._reload_lock:
+            started = time.perf_counter()
+            signature = self._source_signature()
+            records = columns_to_records(load_emu_sources(self.spec, self.cache_dir))
+            by_login = {}
+            for user in records:
+                if user.login is not None and user.login != "":
+                    by_login.setdefault(user.login, user)  # First row per login, as in the file-based flows
+            by_email = build_email_index(records, self.alias_domains)
+            self._state = {"by_login": by_login, "by_email": by_email, "users": len(records), "loaded_at": time.time()}
+            self._signature = signature
+            self._checked_at = time.monotonic()
+            logging.info(f"Loaded {len(records)} EMU users from {self.spec} in {time.perf_counter() - started:.2f}s")
+
+    # Rebuild the indexes when a workbook changed; another thread's rebuild is not waited for
+    def refresh(self):
+        if time.monotonic() - self._checked_at < RELOAD_CHECK_INTERVAL:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            changed = self._source_signature() != self._signature
+        except OSError as e:
+            logging.warning(f"Could not check {self.spec} for changes: {e}")
+            return
+        if changed and not self._reload_lock.locked():
+            logging.info(f"{self.spec} changed; reloading")
+            try:
+                self.reload()
+            except Exception as e:
+                logging.error(f"Reload of {self.spec} failed, still serving the previous data: {e}")
+
+    # Return ({login: record}, {email: record}) for the keys that match; emails are normalized here too
+    def lookup(self, logins=(), emails=()):
+        self.refresh()
+        state = self._state
+        by_login, by_email = state["by_login"], state["by_email"]
+        found_logins = {login: by_login[login] for login in logins if login in by_login}
+        found_emails = {}
+        for email in emails:
+            user = by_email.get(normalize_email(email, self.alias_domains))
+            if user is not None:
+                found_emails[email] = user
+        return found_logins, found_emails
+
+    def health(self):
+        state = self._state
+        return {"spec": self.spec, "users": state["users"], "loaded_at": state["loaded_at"]}
+
+
+def _record_dict(user):
+    return {column: user[column] for column in EMU_COLUMNS}
+
+def _build_handler(index):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+        def _send(self, status, body):
+            payload = json.dumps(body, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            if self.path != "/health":
+                return self._send(404, {"message": "Not Found"})
+            self._send(200, index.health())
+
+        # POST /lookup {"logins": [...], "emails": [...]} -> {"logins": {login: user}, "emails": {email: user}}
+        def do_POST(self):
+            if self.path != "/lookup":
+                return self._send(404, {"message": "Not Found"})
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            except ValueError:
+                return self._send(400, {"message": "Request body must be JSON"})
+            found_logins, found_emails = index.lookup(request.get("logins") or (), request.get("emails") or ())
+            self._send(200, {
+                "logins": {login: _record_dict(user) for login, user in found_logins.items()},
+                "emails": {email: _record_dict(user) for email, user in found_emails.items()},
+            })
+
+    return Handler
+
+# Load the EMU directory once and answer lookups until interrupted
+def serve(spec, host=MAPPING_SERVICE_HOST, port=MAPPING_SERVICE_PORT, cache_dir=None, alias_domains=None):
+    index = WarmIndex(spec, cache_dir, alias_domains)
+    server = ThreadingHTTPServer((host, port), _build_handler(index))
+    server.daemon_threads = True
+    logging.info(f"Mapping service for {spec} listening on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+# Client for a running mapping service; records come back as EmuUser like a local load
+class MappingServiceClient:
+    def __init__(self, url, timeout=60):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path, body):
+        request = urllib.request.Request(
+            f"{self.url}{path}", data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def health(self):
+        with urllib.request.urlopen(f"{self.url}/health", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    # {key: EmuUser} for the keys the service knows, sent in batches of LOOKUP_BATCH_SIZE
+    def _lookup(self, field, keys):
+        keys = list(dict.fromkeys(key for key in keys if key))
+        found = {}
+        for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            result = self._post("/lookup", {field: keys[start:start + LOOKUP_BATCH_SIZE]})
+            found.update({key: EmuUser(**record) for key, record in result[field].items()})
+        return found
+
+    def lookup_logins(self, logins):
+        return self._lookup("logins", logins)
+
+    def lookup_emails(self, emails):
+        return self._lookup("emails", emails)
+
+
+# Stand-in for the dict from build_email_index: answers get(normalized email) from the service.
+# prefetch() resolves a whole chunk of emails in one request; anything else is fetched on demand.
+class RemoteEmailIndex:
+    def __init__(self, client):
+        self.client = client
+        self._known = {}
+
+    def prefetch(self, emails):
+        missing = [email for email in emails if email and email not in self._known]
+        if missing:
+            found = self.client.lookup_emails(missing)
+            self._known.update({email: found.get(email) for email in missing})
+
+    def get(self, email, default=None):
+        if email not in self._known:
+            self.prefetch([email])
+        user = self._known.get(email)
+        return default if user is None else user
+
+# Client for MAPPING_SERVICE_URL when it is set, otherwise None (load the EMU workbook locally)
+def open_mapping_service(url=MAPPING_SERVICE_URL):
+    if not url:
+        return None
+    client = MappingServiceClient(url)
+    health = client.health()
+    logging.info(f"Using mapping service at {url} ({health['users']} EMU users from {health['spec']})")
+    return client
+
+if __name__ == "__main__":
+    # Usage: python mapping_service.py (EMU_USERS_FILE, EMU_CACHE_DIR, EMAIL_ALIAS_DOMAINS and MAPPING_SERVICE_* from the environment)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    serve(os.getenv("EMU_USERS_FILE"), cache_dir=os.getenv("EMU_CACHE_DIR"),
+          alias_domains=parse_alias_domains(os.getenv("EMAIL_ALIAS_DOMAINS")))
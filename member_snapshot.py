@@ -0,0 +1,87 @@
+import logging
+import sqlite3
+import time
+
+from run_metrics import METRICS
+
+
+# Persisted copy of an org's member list (login, id, email, last seen) kept in SQLite.
+# A sync diffs the current listing against it: only members that joined since the last run
+# (or whose email is older than `refresh_after` seconds) need their profile fetched again.
+class MemberSnapshot:
+    def __init__(self, path, org, refresh_after=None):
+        self.org = org
+        self.refresh_after = refresh_after
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS members ("
+            "org TEXT, login TEXT, id INTEGER, email TEXT, fetched_at REAL, last_seen REAL, "
+            "PRIMARY KEY (org, login))"
+        )
+        self._conn.commit()
+
+    # Sync the snapshot with `members` (the full current listing) and return {login: email}.
+    # `resolve_emails(logins, failed)` takes the logins that need a profile lookup, returns {login: email}
+    # and adds the logins whose lookup failed to the `failed` set. Those are not saved (a known member keeps
+    # its previous email), so the next sync fetches them again.
+    # Departed members are only dropped once the listing has been consumed completely.
+    def sync(self, members, resolve_emails):
+        started = time.time()
+        known = {
+            login: fetched_at
+            for login, fetched_at in self._conn.execute("SELECT login, fetched_at FROM members WHERE org = ?", (self.org,))
+        }
+
+        seen, pending = {}, []
+        for member in members:
+            login = member["login"]
+            seen[login] = member.get("id")
+            fetched_at = known.get(login)
+            if fetched_at is None or (self.refresh_after is not None and started - fetched_at > self.refresh_after):
+                pending.append(login)
+
+        failed = set()
+        emails = resolve_emails(pending, failed) if pending else {}
+        fetched = [login for login in pending if login not in failed]
+        departed = [login for login in known if login not in seen]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO members (org, login, id, email, fetched_at, last_seen) VALUES (?, ?, ?, ?, ?, ?)",
+                ((self.org, login, seen[login], emails.get(login), started, started) for login in fetched),
+            )
+            self._conn.executemany(
+                "UPDATE members SET id = ?, last_seen = ? WHERE org = ? AND login = ?",
+                ((seen[login], started, self.org, login) for login in seen if login in known and login not in fetched),
+            )
+            self._conn.executemany("DELETE FROM members WHERE org = ? AND login = ?", ((self.org, login) for login in departed))
+
+        new = sum(1 for login in fetched if login not in known)
+        METRICS.count("members_new", new)
+        METRICS.count("members_refreshed", len(fetched) - new)
+        METRICS.count("members_departed", len(departed))
+        METRICS.count("members_lookup_failed", len(failed))
+        logging.info(f"Member snapshot for {self.org}: {len(seen)} members, {new} new, "
+                     f"{len(fetched) - new} refreshed, {len(departed)} departed")
+        if failed:
+            logging.warning(f"Email lookup failed for {len(failed)} members of {self.org}; they are retried on the next sync")
+        return self.emails()
+
+    def emails(self):
+        return dict(self._conn.execute(
+            "SELECT login, email FROM members WHERE org = ? AND email IS NOT NULL AND email != ''", (self.org,)
+        ))
+
+    def close(self):
+        self._conn.close()
+
+# Open the snapshot when MEMBER_SNAPSHOT_PATH is configured, otherwise return None (full re-listing).
+# `refresh_days` re-fetches emails older than that many days; by default emails are kept until a member leaves.
+def open_member_snapshot(path, org, refresh_days=None):
+    if not path:
+        return None
+    try:
+        refresh_after = float(refresh_days) * 24 * 60 * 60 if refresh_days else None
+    except ValueError:
+        refresh_after = None
+    return MemberSnapshot(path, org, refresh_after)
@@ -0,0 +1,275 @@
+import csv
+import logging
+import os
+import sys
+import threading
+import time
+
+from async_resolver import parse_concurrency, resolve_concurrently
+from csv_stream import iter_chunks, iter_csv_rows
+from github_client import get_client
+from graphql_lookup import GITHUB_GRAPHQL_URL, fetch_user_ids_batch
+from run_metrics import METRICS
+from row_log import open_row_log, setup_logging
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# Set up logging (queued to a background thread in quiet mode)
+QUIET_MODE = os.getenv('QUIET_MODE', '').lower() in ('1', 'true', 'yes')  # Progress counters instead of per-row output
+setup_logging(QUIET_MODE)
+
+# Environment variables
+GITHUB_TOKEN = os.getenv('GITHUB_TOKEN')
+ORG_NAME = os.getenv('ORG_NAME')
+USER_MAPPINGS_FILE = os.getenv('USER_MAPPINGS_FILE', 'user-mappings-template.csv')
+RECLAIM_CONCURRENCY = parse_concurrency(os.getenv('RECLAIM_CONCURRENCY'), default=8)  # Mutations in flight at once
+RECLAIM_MIN_INTERVAL = float(os.getenv('RECLAIM_MIN_INTERVAL') or 0)  # Seconds between mutations across all workers
+RECLAIM_RESULTS_CSV = os.getenv('RECLAIM_RESULTS_CSV')  # Defaults to <mappings>.reclaim.csv
+RECLAIM_SKIP_INVITATION = os.getenv('RECLAIM_SKIP_INVITATION', '').lower() in ('1', 'true', 'yes')  # EMU: reattribute directly
+RECLAIM_CHUNK_SIZE = 1000  # Rows whose target IDs are looked up and submitted together
+
+RESULT_FIELDNAMES = ["mannequin-user", "mannequin-id", "target-user", "status", "message"]
+DONE_STATUSES = ("reclaimed", "invited", "already-claimed")  # Rows with these results are never submitted again
+# "lookup-failed": the target user's ID could not be looked up (HTTP or GraphQL error); retried on the next run
+# "unknown": the mutation got a 5xx or lost its connection and may have been applied; it is not retried within
+# the run, and the next run submits it again unless the mannequin's claimant shows it went through
+
+ORG_ID_QUERY = "query($login: String!) { organization(login: $login) { id } }"
+MANNEQUINS_QUERY = """query($login: String!, $after: String) {
+  organization(login: $login) {
+    mannequins(first: 100, after: $after) {
+      pageInfo { endCursor hasNextPage }
+      nodes { id login claimant { login } }
+    }
+  }
+}"""
+INVITE_MUTATION = """mutation($orgId: ID!, $sourceId: ID!, $targetId: ID!) {
+  createAttributionInvitation(input: {ownerId: $orgId, sourceId: $sourceId, targetId: $targetId}) {
+    source { ... on Mannequin { id login } }
+    target { ... on User { id login } }
+  }
+}"""
+REATTRIBUTE_MUTATION = """mutation($orgId: ID!, $sourceId: ID!, $targetId: ID!) {
+  reattributeMannequinToUser(input: {orgId: $orgId, sourceId: $sourceId, targetId: $targetId}) {
+    source { ... on Mannequin { id login } }
+    target { ... on User { id login } }
+  }
+}"""
+
+
+# Append-only CSV of reclaim outcomes, one line per submitted row. The last line for a
+# mannequin-id wins on reload, so a rerun skips whatever an earlier run already reclaimed.
+class ReclaimResults:
+    def __init__(self, path):
+        self.path = path
+        self._done = {}
+        self._lock = threading.Lock()
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            with open(path, mode='r', newline='', encoding='utf-8') as file:
+                for row in csv.DictReader(file):
+                    if row.get("status") in DONE_STATUSES:
+                        self._done[row["mannequin-id"]] = row.get("target-user")
+                    else:
+                        self._done.pop(row.get("mannequin-id"), None)
+            logging.info(f"Resuming from {path}: {len(self._done)} mannequins already reclaimed")
+        self._file = open(path, mode='a', newline='', encoding='utf-8')
+        self._writer = csv.DictWriter(self._file, fieldnames=RESULT_FIELDNAMES, extrasaction='ignore')
+        if not exists:
+            self._writer.writeheader()
+
+    # True when a previous run reclaimed this mannequin for the same target user
+    def done(self, mannequin_id, target_user):
+        return self._done.get(mannequin_id) == target_user
+
+    # Called from the worker threads; every outcome is flushed as soon as it is known
+    def record(self, row, status, message=""):
+        with self._lock:
+            self._writer.writerow({**row, "status": status, "message": message})
+            self._file.flush()
+            if status in DONE_STATUSES:
+                self._done[row.get("mannequin-id")] = row.get("target-user")
+
+    def close(self):
+        self._file.close()
+
+
+# Spaces mutations at least `min_interval` seconds apart across all workers, on top of the
+# client's own rate-limit pacing, to stay clear of the secondary limits on mutations
+class MutationPacer:
+    def __init__(self, min_interval=0.0):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        if not self.min_interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        delay = slot - now
+        if delay > 0:
+            METRICS.count("rate_limit_wait_seconds", delay)
+            time.sleep(delay)
+
+
+# Function to run one GraphQL request and return (data, errors); HTTP errors carry their status code.
+# These are org-owner calls, so they always go out with `token`, never with a pooled credential.
+def run_graphql(query, variables, token, idempotent=True):
+    headers = {
+        "Authorization": f"bearer {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    response = get_client(token, pooled=False).post(
+        GITHUB_GRAPHQL_URL, json={"query": query, "variables": variables}, headers=headers, idempotent=idempotent
+    )
+    if response.status_code != 200:
+        return None, [{"message": f"HTTP {response.status_code}", "status": response.status_code}]
+    payload = response.json()
+    return payload.get("data") or {}, payload.get("errors") or []
+
+# Function to fetch the organization's node ID
+def fetch_org_id(org_name, token):
+    data, errors = run_graphql(ORG_ID_QUERY, {"login": org_name}, token)
+    organization = (data or {}).get("organization")
+    if not organization:
+        raise RuntimeError(f"Could not look up organization {org_name}: {'; '.join(e.get('message', '') for e in errors)}")
+    return organization["id"]
+
+# Function to list who already claimed each of the org's mannequins, {mannequin-id: claimant login}.
+# One call per 100 mannequins; this also catches reclaims done by hand or by an earlier tool.
+def fetch_claimed_mannequins(org_name, token):
+    claimed, after = {}, None
+    while True:
+        data, errors = run_graphql(MANNEQUINS_QUERY, {"login": org_name, "after": after}, token)
+        mannequins = ((data or {}).get("organization") or {}).get("mannequins")
+        if not mannequins:
+            raise RuntimeError(f"Listing mannequins of {org_name} failed: {'; '.join(e.get('message', '') for e in errors)}")
+        for node in mannequins["nodes"]:
+            if node.get("claimant"):
+                claimed[node["id"]] = node["claimant"]["login"]
+        if not mannequins["pageInfo"]["hasNextPage"]:
+            return claimed
+        after = mannequins["pageInfo"]["endCursor"]
+
+# Function to submit one reclaim and return (status, message)
+def submit_reclaim(org_id, mannequin_id, target_id, token, skip_invitation=False, pacer=None):
+    if pacer is not None:
+        pacer.wait()
+    mutation = REATTRIBUTE_MUTATION if skip_invitation else INVITE_MUTATION
+    variables = {"orgId": org_id, "sourceId": mannequin_id, "targetId": target_id}
+    try:
+        data, errors = run_graphql(mutation, variables, token, idempotent=False)
+    except Exception as e:  # A connection lost after sending; GitHub may still have applied the mutation
+        return "unknown", f"{e} (may have been applied)"
+    if any(error.get("status", 0) >= 500 for error in errors):
+        return "unknown", f"{errors[0]['message']} (may have been applied)"
+    if errors:
+        return "failed", "; ".join(error.get("message", "") for error in errors)
+    return ("reclaimed" if skip_invitation else "invited"), ""
+
+# Function to submit every resolved row of the mappings CSV, `concurrency` mutations at a time.
+# Rows without a target-user are skipped, as are rows an earlier run (results CSV) or anyone else
+# (org mannequin listing) already reclaimed for the same target.
+def reclaim_mannequins(csv_file, org_name, token, results, row_log, concurrency=RECLAIM_CONCURRENCY,
+                       skip_invitation=False, pacer=None):
+    org_id = fetch_org_id(org_name, token)
+    claimed = {mannequin_id: login.casefold() for mannequin_id, login in fetch_claimed_mannequins(org_name, token).items()}
+    logging.info(f"{len(claimed)} mannequins of {org_name} are already claimed")
+    failed = 0
+
+    for chunk in iter_chunks(iter_csv_rows(csv_file), RECLAIM_CHUNK_SIZE):
+        pending = []
+        for row in chunk:
+            mannequin_user = row.get("mannequin-user")
+            mannequin_id = (row.get("mannequin-id") or "").strip()
+            target_user = (row.get("target-user") or "").strip()
+            if not mannequin_id or not target_user:
+                row_log.record("skipped", f"Skipping {mannequin_user}: no target-user", row)
+                METRICS.count("rows_skipped")
+            elif results.done(mannequin_id, target_user):
+                row_log.record("resumed", f"Already reclaimed in an earlier run: {mannequin_user} -> {target_user}")
+                METRICS.count("rows_resumed")
+            elif mannequin_id in claimed:
+                if claimed[mannequin_id] == target_user.casefold():
+                    results.record(row, "already-claimed")
+                    row_log.record("already-claimed", f"Already claimed: {mannequin_user} -> {target_user}")
+                else:
+                    results.record(row, "conflict", f"Claimed by {claimed[mannequin_id]}")
+                    row_log.record("conflict", f"{mannequin_user} is already claimed by another user", row, logging.WARNING)
+                    failed += 1
+            else:
+                pending.append(row)
+
+        with METRICS.stage("reclaim"):
+            lookup_failed = set()
+            target_ids = fetch_user_ids_batch((row["target-user"].strip() for row in pending), token, failed=lookup_failed)
+            submittable = []
+            for row in pending:
+                target_id = target_ids.get(row["target-user"].strip())
+                if row["target-user"].strip() in lookup_failed:
+                    results.record(row, "lookup-failed", "Target user lookup failed; retried on the next run")
+                    row_log.record("lookup-failed", f"Could not look up target user {row['target-user']} for {row.get('mannequin-user')}", row, logging.WARNING)
+                    METRICS.count("reclaims_lookup_failed")
+                    failed += 1
+                elif target_id is None:
+                    results.record(row, "failed", "Target user not found")
+                    row_log.record("failed", f"Target user {row['target-user']} not found for {row.get('mannequin-user')}", row, logging.WARNING)
+                    failed += 1
+                else:
+                    submittable.append((row, target_id))
+
+            def submit(item):
+                row, target_id = item
+                status, message = submit_reclaim(org_id, row["mannequin-id"].strip(), target_id, token, skip_invitation, pacer)
+                results.record(row, status, message)
+                return status, message
+
+            outcomes = resolve_concurrently(submittable, submit, concurrency)
+        METRICS.add_rows("reclaim", len(submittable))
+
+        for (row, _), (status, message) in zip(submittable, outcomes):
+            if status == "failed":
+                row_log.record("failed", f"Reclaim failed for {row.get('mannequin-user')}: {message}", row, logging.WARNING)
+                METRICS.count("reclaims_failed")
+                failed += 1
+            elif status == "unknown":
+                row_log.record("unknown", f"Reclaim outcome unknown for {row.get('mannequin-user')}: {message}", row, logging.WARNING)
+                METRICS.count("reclaims_unknown")
+                failed += 1
+            else:
+                row_log.record(status, f"Reclaim {status}: {row.get('mannequin-user')} -> {row['target-user']}")
+                METRICS.count("reclaims_submitted")
+    return failed
+
+def main():
+    if not all([GITHUB_TOKEN, ORG_NAME, USER_MAPPINGS_FILE]):
+        logging.error("Missing required environment variables. Please check your .env file.")
+        return 1
+
+    results_path = RECLAIM_RESULTS_CSV or f"{os.path.splitext(USER_MAPPINGS_FILE)[0]}.reclaim.csv"
+    results = ReclaimResults(results_path)
+    row_log = open_row_log(USER_MAPPINGS_FILE, QUIET_MODE)
+    try:
+        failed = reclaim_mannequins(
+            USER_MAPPINGS_FILE, ORG_NAME, GITHUB_TOKEN, results, row_log,
+            RECLAIM_CONCURRENCY, RECLAIM_SKIP_INVITATION, MutationPacer(RECLAIM_MIN_INTERVAL),
+        )
+        logging.info(f"Reclaim results written to {results_path}")
+        return 1 if failed else 0
+    except Exception as e:
+        logging.error(f"An error occurred: {str(e)}")
+        return 1
+    finally:
+        row_log.close()
+        results.close()
+        METRICS.write_report()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+import atexit
+import csv
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from csv_stream import MAPPING_FIELDNAMES
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+PROGRESS_INTERVAL = int(os.getenv("PROGRESS_INTERVAL") or 10000)  # Rows between progress lines in quiet mode
+EXCEPTION_OUTCOMES = ("skipped", "no-match", "no-email")  # Outcomes copied to the exceptions CSV
+
+
+# Configure the root logger. In quiet mode records are handed to a queue and written by a
+# background listener thread, so a slow console never blocks the thread doing the matching.
+def setup_logging(quiet=False, level=logging.INFO, fmt=LOG_FORMAT):
+    if not quiet:
+        logging.basicConfig(level=level, format=fmt)
+        return None
+    log_queue = queue.SimpleQueue()
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(fmt))
+    listener = QueueListener(log_queue, console)
+    listener.start()
+    atexit.register(listener.stop)  # Drains whatever is still queued
+    handler = QueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter('%(message)s'))  # The listener's handler applies `fmt`
+    logging.basicConfig(level=level, handlers=[handler], force=True)
+    return listener
+
+
+# Per-row outcome log. Normally every row's message is written as before; in quiet mode the
+# messages are dropped and outcomes are tallied into a progress line every `interval` rows.
+# Unmatched and skipped rows are also copied to an exceptions CSV when a path is given.
+# `printer` sends messages to print() instead of the logging module (the pandas scripts).
+class RowLog:
+    def __init__(self, quiet=False, exceptions_path=None, interval=PROGRESS_INTERVAL, printer=None):
+        self.quiet = quiet
+        self.exceptions_path = exceptions_path
+        self.interval = interval
+        self.printer = printer
+        self.rows = 0
+        self.outcomes = {}
+        self.exceptions = 0
+        self._exceptions_file = None
+        self._exceptions_writer = None
+
+    def _emit(self, message, level=logging.INFO):
+        if self.printer is not None:
+            self.printer(message)
+        else:
+            logging.log(level, message)
+
+    def record(self, outcome, message=None, row=None, level=logging.INFO):
+        self.rows += 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if outcome in EXCEPTION_OUTCOMES and row is not None and self.exceptions_path:
+            self._write_exception(row, outcome)
+        if not self.quiet:
+            if message:
+                self._emit(message, level)
+        elif self.rows % self.interval == 0:
+            self._emit(f"Processed {self.rows} rows ({self.summary()})")
+
+    def _write_exception(self, row, reason):
+        # Opened on the first exception so clean runs leave no empty file behind
+        if self._exceptions_writer is None:
+            self._exceptions_file = open(self.exceptions_path, mode='w', newline='', encoding='utf-8')
+            self._exceptions_writer = csv.DictWriter(
+                self._exceptions_file, fieldnames=[*MAPPING_FIELDNAMES, "reason"], extrasaction='ignore'
+            )
+            self._exceptions_writer.writeheader()
+        self._exceptions_writer.writerow({**row, "reason": reason})
+        self.exceptions += 1
+
+    def summary(self):
+        return ", ".join(f"{outcome} {count}" for outcome, count in sorted(self.outcomes.items()))
+
+    def close(self):
+        if self._exceptions_file is not None:
+            self._exceptions_file.close()
+        if self.quiet:
+            self._emit(f"Finished {self.rows} rows ({self.summary() or 'none'})")
+            if self.exceptions:
+                self._emit(f"{self.exceptions} unmatched or skipped rows written to {self.exceptions_path}")
+
+# Row log for one mappings CSV. EXCEPTIONS_CSV sets the exceptions file; in quiet mode it
+# defaults to <mappings>.exceptions.csv next to the mappings file.
+def open_row_log(mappings_path, quiet=False, printer=None):
+    exceptions_path = os.getenv("EXCEPTIONS_CSV")
+    if exceptions_path is None and quiet:
+        exceptions_path = f"{os.path.splitext(mappings_path)[0]}.exceptions.csv"
+    return RowLog(quiet, exceptions_path or None, printer=printer)
@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Per-stage wall time, row counts and run-wide counters, written as a JSON report at the end of a run.
+# Stage time is exclusive: when stages nest on one thread (e.g. a streaming write pulling rows through
+# matching), the inner stage's time is not also charged to the outer one.
+class RunMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.started = time.time()
+        self._started_perf = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name):
+        stack = self._local.__dict__.setdefault("stack", [])
+        now = time.perf_counter()
+        if stack:
+            self._add_time(stack[-1][0], now - stack[-1][1])
+        stack.append([name, now])
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            stage_name, stage_started = stack.pop()
+            self._add_time(stage_name, now - stage_started)
+            if stack:
+                stack[-1][1] = now
+
+    def _add_time(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "rows": 0})
+            entry["seconds"] += seconds
+
+    def add_rows(self, name, rows):
+        with self._lock:
+            entry = self.stages.setdefault(name, {"seconds": 0.0, "rows": 0})
+            entry["rows"] += rows
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def report(self):
+        with self._lock:
+            return {
+                "script": os.path.basename(sys.argv[0]),
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+                "total_seconds": round(time.perf_counter() - self._started_perf, 3),
+                "stages": {name: {"seconds": round(entry["seconds"], 3), "rows": entry["rows"]}
+                           for name, entry in self.stages.items()},
+                "counters": {name: round(value, 3) if isinstance(value, float) else value
+                             for name, value in sorted(self.counters.items())},
+            }
+
+    # Write the JSON report; RUN_REPORT="" turns the report off
+    def write_report(self, file_path=None):
+        file_path = os.getenv("RUN_REPORT", "run-report.json") if file_path is None else file_path
+        if not file_path:
+            return None
+        report = self.report()
+        with open(file_path, mode='w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        logging.info(f"Run report written to {file_path}")
+        return report
+
+
+# Process-wide metrics shared by the scripts and the helper modules they use
+METRICS = RunMetrics()
@@ -1,81 +1,138 @@
-import csv
 import os
-import requests
+import sys
+from github_client import GITHUB_API_URL, get_client
+from async_resolver import parse_concurrency, resolve_concurrently
+from csv_stream import iter_csv_rows, write_csv_atomically
+from graphql_lookup import fetch_user_emails_batch, get_saml_emails
+from user_cache import open_user_cache
+from run_metrics import METRICS
+from row_log import RowLog, open_row_log
+from member_snapshot import open_member_snapshot
 
-# Code A: Fetch GitHub organization members
-def fetch_org_members(org_name, token):
-    url = f"https://api.github.com/orgs/{org_name}/members"
+# Code A: Fetch GitHub organization members (generator over all pages)
+# With strict=True a failed page raises instead of ending the listing early, so callers can tell
+# a partial listing from the whole org.
+def fetch_org_members(org_name, token, cache=None, strict=False):
+    url = f"{GITHUB_API_URL}/orgs/{org_name}/members"
     headers = {
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json"
     }
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()  # Return the list of members
-    else:
-        print(f"Error fetching members: {response.status_code}")
-        print(response.json())
-        return []
+    params = {"per_page": 100}
+    # Yield members page by page, following the Link rel="next" header
+    while url:
+        with METRICS.stage("member_fetch"):
+            if cache is not None:
+                response = cache.get_page(url, headers, params)
+            else:
+                response = get_client(token).get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            print(f"Error fetching members: {response.status_code}")
+            print(response.json())
+            if strict:
+                raise RuntimeError(f"Listing members of {org_name} failed with status {response.status_code}")
+            return
+        members = response.json()
+        METRICS.add_rows("member_fetch", len(members))
+        yield from members  # Stream this page of members
+        url = response.links.get("next", {}).get("url")
+        params = None  # The next link already carries per_page and page
 
 # Code B: Fetch email by GitHub username
-def fetch_user_email(username, token):
-    url = f"https://api.github.com/users/{username}"
+def fetch_user_email(username, token, cache=None, failed=None):
+    url = f"{GITHUB_API_URL}/users/{username}"
     headers = {
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json"
     }
-    response = requests.get(url, headers=headers)
+    if cache is not None:
+        response = cache.get_user(username, url, headers)
+    else:
+        response = get_client(token).get(url, headers=headers)
     if response.status_code == 200:
         user_data = response.json()
         return user_data.get("email")  # Return email
     else:
         print(f"Error fetching email for {username}: {response.status_code}")
         print(response.json())
+        # A 404 is a definite answer (no such user); anything else is worth retrying on the next run
+        if failed is not None and response.status_code != 404:
+            failed.add(username)
         return None
 
+# Match each CSV row against the org members as it is read
+def match_csv_rows(csv_file, username_to_email, row_log=None):
+    row_log = row_log or RowLog(printer=print)
+    for row in iter_csv_rows(csv_file):
+        mannequin_user = row['mannequin-user']  # GitHub handle
+        mannequin_id = row['mannequin-id']
+        target_user = row.get('target-user', '')  # Default to empty if not present
+
+        # Match the mannequin-user with the username in the organization
+        if mannequin_user in username_to_email:
+            target_user = mannequin_user  # If match is found, use the same username
+            row_log.record("matched", f"Match found: {mannequin_user} -> {target_user}")
+            METRICS.count("rows_matched")
+        else:
+            row_log.record("no-match", f"No match found for: {mannequin_user}", row)
+            METRICS.count("rows_unmatched")
+
+        # Update the row with the target-user
+        row['target-user'] = target_user
+        yield row
+
+# Look up the email of every username, using the batched, concurrent or serial resolver
+# The "saml" resolver reads the SAML nameId of each member from one sweep of `saml_org`
+# Usernames whose lookup failed (as opposed to having no email) are added to `failed` when given
+def resolve_member_emails(usernames, token, concurrency=1, resolver="rest", cache=None, saml_org=None, failed=None):
+    username_to_email = {}
+    if resolver == "graphql":
+        username_to_email = fetch_user_emails_batch(usernames, token, failed=failed)
+    elif resolver == "saml":
+        saml_emails = get_saml_emails(saml_org, token)
+        for username in usernames:
+            email = saml_emails.get(username.casefold())
+            if email:
+                username_to_email[username] = email  # Map username to email
+    elif concurrency > 1:
+        # Lookups start while later member pages are still being fetched
+        results = resolve_concurrently(usernames, lambda username: (username, fetch_user_email(username, token, cache, failed)), concurrency)
+        for username, email in results:
+            if email:
+                username_to_email[username] = email  # Map username to email
+    else:
+        for username in usernames:
+            email = fetch_user_email(username, token, cache, failed)
+            if email:
+                username_to_email[username] = email  # Map username to email
+    return username_to_email
+
 # Process the CSV file to update target-user
-def process_csv_and_update(csv_file, org_name, token):
+def process_csv_and_update(csv_file, org_name, token, concurrency=1, resolver="rest", cache=None, row_log=None, snapshot=None, saml_org=None):
     # Step 1: Fetch organization members
     print(f"Fetching members of the organization: {org_name}")
-    members = fetch_org_members(org_name, token)
+    members = fetch_org_members(org_name, token, cache, strict=snapshot is not None)
 
     # Step 2: Create a mapping of usernames to emails
     print("Fetching emails for organization members...")
-    username_to_email = {}
-    for member in members:
-        username = member['login']
-        email = fetch_user_email(username, token)
-        if email:
-            username_to_email[username] = email  # Map username to email
-
-    # Step 3: Process the CSV file
-    print(f"Processing the CSV file: {csv_file}")
-    updated_rows = []
-    with open(csv_file, 'r', newline='', encoding='utf-8') as infile:
-        reader = csv.DictReader(infile)
-        for row in reader:
-            mannequin_user = row['mannequin-user']  # GitHub handle
-            mannequin_id = row['mannequin-id']
-            target_user = row.get('target-user', '')  # Default to empty if not present
-
-            # Match the mannequin-user with the username in the organization
-            if mannequin_user in username_to_email:
-                target_user = mannequin_user  # If match is found, use the same username
-                print(f"Match found: {mannequin_user} -> {target_user}")
-            else:
-                print(f"No match found for: {mannequin_user}")
-
-            # Update the row with the target-user
-            row['target-user'] = target_user
-            updated_rows.append(row)
+    # Member pages are pulled lazily by the lookups below; their time is charged to member_fetch
+    with METRICS.stage("email_resolution"):
+        if snapshot is not None:
+            # Only members that joined since the last sync need a profile lookup
+            username_to_email = snapshot.sync(
+                members,
+                lambda usernames, failed: resolve_member_emails(usernames, token, concurrency, resolver, cache, saml_org or org_name, failed),
+            )
+        else:
+            username_to_email = resolve_member_emails(
+                (member['login'] for member in members), token, concurrency, resolver, cache, saml_org or org_name
+            )
+    METRICS.add_rows("email_resolution", len(username_to_email))
 
-    # Step 4: Write the updated data back to the CSV file
-    print(f"Updating the CSV file: {csv_file}")
-    with open(csv_file, 'w', newline='', encoding='utf-8') as outfile:
-        fieldnames = ['mannequin-user', 'mannequin-id', 'target-user']
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(updated_rows)
+    # Step 3 and 4: Stream the CSV rows through the matcher into a temp file that atomically replaces it
+    print(f"Processing and updating the CSV file: {csv_file}")
+    fieldnames = ['mannequin-user', 'mannequin-id', 'target-user']
+    write_csv_atomically(csv_file, match_csv_rows(csv_file, username_to_email, row_log), fieldnames)
 
     print(f"CSV update completed. File saved as '{csv_file}'.")
 
@@ -84,15 +141,33 @@ def main():
     # Define environment variables or replace with hardcoded values
     org_name = os.getenv("ORG_NAME", "mgmrri")  # Replace with your organization name
     token = os.getenv("GITHUB_TOKEN", "your_github_token_here")  # Replace with your GitHub token
-    csv_file = "user-mappings-template.csv"  # Fixed file name as per the requirement
+    csv_file = os.getenv("USER_MAPPINGS_FILE", "user-mappings-template.csv")  # Default file name as per the requirement
+    concurrency = parse_concurrency(os.getenv("RESOLVE_CONCURRENCY"))  # Parallel /users lookups
+    resolver = os.getenv("EMAIL_RESOLVER", "rest")  # "graphql" batches 100 logins per request, "saml" sweeps SAML identities
+    saml_org = os.getenv("SAML_ORG")  # Org whose SAML identities are swept (default: ORG_NAME)
+    cache_path = os.getenv("USER_CACHE_PATH")  # SQLite profile cache shared across runs
+    quiet = os.getenv("QUIET_MODE", "").lower() in ("1", "true", "yes")  # Progress counters instead of per-row output
+    snapshot_path = os.getenv("MEMBER_SNAPSHOT_PATH")  # SQLite member snapshot for incremental syncs
 
     # Validate environment variables
     if not org_name or not token:
         print("Please set the environment variables ORG_NAME and GITHUB_TOKEN.")
-        return
+        return 1
 
     # Run the process
-    process_csv_and_update(csv_file, org_name, token)
+    cache = open_user_cache(cache_path, os.getenv("USER_CACHE_TTL"), token)
+    row_log = open_row_log(csv_file, quiet, printer=print)
+    snapshot = open_member_snapshot(snapshot_path, org_name, os.getenv("MEMBER_SNAPSHOT_REFRESH_DAYS"))
+    try:
+        process_csv_and_update(csv_file, org_name, token, concurrency, resolver, cache, row_log, snapshot, saml_org)
+        return 0
+    finally:
+        row_log.close()
+        if snapshot is not None:
+            snapshot.close()
+        if cache is not None:
+            cache.close()
+        METRICS.write_report()
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
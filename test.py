@@ -1,36 +1,36 @@
 import os
-import requests
-from github import Github
+from github_client import GITHUB_API_URL, get_client
 
 
-GITHUB_TOKEN = ""
-ORG_NAME = ""
-
-# Initialize the GitHub API client
-g = Github(GITHUB_TOKEN)
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
+ORG_NAME = os.getenv("ORG_NAME", "")
 
 
 def fetch_org_members(org_name, token):
-    url = f"https://api.github.com/orgs/{org_name}/members"
+    url = f"{GITHUB_API_URL}/orgs/{org_name}/members"
     headers = {
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json"
     }
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"Error: {response.status_code}")
-        print(response.json())
-        return []
+    params = {"per_page": 100}
+    # Yield members page by page, following the Link rel="next" header
+    while url:
+        response = get_client(token).get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            print(f"Error: {response.status_code}")
+            print(response.json())
+            return
+        yield from response.json()
+        url = response.links.get("next", {}).get("url")
+        params = None  # The next link already carries per_page and page
 
 def fetch_user_email(username, token):
-    url = f"https://api.github.com/users/{username}"
+    url = f"{GITHUB_API_URL}/users/{username}"
     headers = {
         "Authorization": f"token {token}",
         "Accept": "application/vnd.github.v3+json"
     }
-    response = requests.get(url, headers=headers)
+    response = get_client(token).get(url, headers=headers)
     if response.status_code == 200:
         user_data = response.json()
         return user_data.get("email")
@@ -0,0 +1,109 @@
+import csv
+import io
+import os
+
+import pandas as pd
+
+from csv_stream import write_csv_atomically
+from fuzzy_match import FuzzyMatcher
+from login_match import join_mapping_chunks, resolve_user_mappings
+from row_log import RowLog
+
+# The vectorized join (MAPPING_MODE=join) must write the same CSV, messages, outcomes and journal
+# entries as the per-row loop, including on the awkward rows below.
+
+ORG_SUFFIX = "acme"
+
+EMU_ROWS = [
+    ("alice", "Alice Adams", "alice@example.com"),
+    ("bob", "Bob Brown", ""),                       # Blank email
+    ("carol", "Carol Clark", None),                 # Missing email
+    ("dave", "Dave Davis", "dave@example.com"),     # Duplicate login: the first row wins
+    ("dave", "Dave Davis", "dave2@example.com"),
+    ("erin", "Erin Evans", None),                   # Duplicate login whose first row has no email: fuzzy takes the other
+    ("erin", "Erin Evans", "erin@example.com"),
+    (12345, "Numeric Login", "num@example.com"),    # Numeric login as read from a workbook
+    ("67890", "Text Digits", " digits@example.com "),
+    ("jsmith", "John Smith", "js1@example.com"),     # Two John Smiths: a fuzzy tie goes to review
+    ("johnsmith", "John Smith", "js2@example.com"),
+    ("frankmiller", "Frank Miller", "frank@example.com"),
+    ("georgeharris", "George Harris", None),        # Fuzzy candidate without an email
+]
+
+MAPPINGS = [
+    ("alice", "M_1", ""),
+    ("bob", "M_2", ""),
+    ("carol", "M_3", ""),
+    ("dave", "M_4", ""),
+    ("erin", "M_5", ""),
+    ("12345", "M_6", ""),
+    ("67890", "M_7", ""),
+    ("", "M_8", ""),                  # No mannequin-user
+    ("preset", "M_9", "keep_acme"),  # Already resolved in the CSV
+    ("journaled", "M_10", ""),        # Already resolved in the journal
+    ("nobody", "M_11", ""),
+    ("john-smith", "M_12", ""),
+    ("frank-miller", "M_13", ""),
+    ("george-harris", "M_14", ""),
+    ("alice", "M_15", ""),           # Same mannequin-user twice
+]
+
+
+class RecordingJournal:
+    def __init__(self):
+        self.records = []
+
+    def resolved_target(self, mannequin_id):
+        return "journaled_acme" if mannequin_id == "M_10" else None
+
+    def record(self, mannequin_id, status, target_user=None):
+        self.records.append((mannequin_id, status, target_user))
+
+
+def run_mode(tmp_path, mode):
+    emu_users_df = pd.DataFrame(EMU_ROWS, columns=["login", "name", "saml_name_id"], dtype=object)
+    rows = [{"mannequin-user": user, "mannequin-id": mannequin_id, "target-user": target}
+            for user, mannequin_id, target in MAPPINGS]
+    messages = []
+    row_log = RowLog(printer=messages.append)
+    journal = RecordingJournal()
+    review_path = tmp_path / f"{mode}.review.csv"
+    fuzzy = FuzzyMatcher(emu_users_df.to_dict("records"), review_path=str(review_path), require_email=True)
+    if mode == "join":
+        chunks = [rows[start:start + 4] for start in range(0, len(rows), 4)]
+        mappings = join_mapping_chunks(chunks, emu_users_df, ORG_SUFFIX, journal, row_log, fuzzy)
+    else:
+        mappings = resolve_user_mappings(rows, emu_users_df, ORG_SUFFIX, journal, row_log, fuzzy)
+    csv_path = tmp_path / f"{mode}.csv"
+    write_csv_atomically(str(csv_path), mappings)
+    fuzzy.close()
+    review = review_path.read_text() if os.path.exists(review_path) else ""
+    return csv_path.read_text(), messages, row_log.outcomes, journal.records, review
+
+
+def test_join_matches_loop(tmp_path):
+    loop = run_mode(tmp_path, "loop")
+    join = run_mode(tmp_path, "join")
+    assert join[0] == loop[0]  # Written CSV
+    assert join[1] == loop[1]  # Per-row messages
+    assert join[2] == loop[2]  # Outcome counts
+    assert join[3] == loop[3]  # Journal entries
+    assert join[4] == loop[4]  # Fuzzy review rows
+
+
+def test_loop_targets(tmp_path):
+    csv_text, messages, outcomes, _, review = run_mode(tmp_path, "loop")
+    targets = {row["mannequin-id"]: row["target-user"] for row in csv.DictReader(io.StringIO(csv_text))}
+    assert targets["M_1"] == targets["M_15"] == "alice_acme"
+    assert targets["M_2"] == targets["M_3"] == ""  # No email is no match, never "nan_acme"
+    assert targets["M_4"] == "dave_acme"
+    assert targets["M_5"] == "erin_acme"
+    assert targets["M_7"] == "digits_acme"
+    assert targets["M_9"] == "keep_acme"
+    assert targets["M_10"] == "journaled_acme"
+    assert targets["M_12"] == ""  # Tied fuzzy candidates are left for review
+    assert targets["M_13"] == "frank_acme"
+    assert targets["M_14"] == ""
+    assert "john-smith" in review
+    assert outcomes["skipped"] == 1
+    assert outcomes["resumed"] == 2
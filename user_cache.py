@@ -0,0 +1,131 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from urllib.parse import urlencode
+
+from github_client import get_client
+from run_metrics import METRICS
+
+DEFAULT_CACHE_TTL = 24 * 60 * 60  # Seconds before a cached entry is revalidated
+
+
+# Minimal stand-in for requests.Response when an answer is served from the cache
+class CachedResponse:
+    def __init__(self, body, next_url=None, revalidated=False):
+        self.status_code = 200
+        self.text = body
+        self.links = {"next": {"url": next_url}} if next_url else {}
+        self.from_cache = True
+        self.revalidated = revalidated
+
+    def json(self):
+        return json.loads(self.text)
+
+
+# SQLite-backed cache for /users/{login} profiles and /orgs/{org}/members pages.
+# Fresh profiles are served locally; stale ones are revalidated with If-None-Match. Member pages are
+# revalidated on every fetch, so a listing always reflects who joined or left (a 304 costs no budget).
+class UserCache:
+    def __init__(self, path, ttl=DEFAULT_CACHE_TTL, get=None):
+        self.ttl = ttl
+        self._get = get or get_client().get
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "login TEXT PRIMARY KEY, profile TEXT, email TEXT, etag TEXT, fetched_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS member_pages ("
+            "url TEXT PRIMARY KEY, body TEXT, next_url TEXT, etag TEXT, fetched_at REAL)"
+        )
+        self._conn.commit()
+
+    # Fetch a user profile, returning a response-like object for the caller's usual status check
+    def get_user(self, username, url, headers):
+        key = username.lower()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT profile, etag, fetched_at, NULL FROM users WHERE login = ?", (key,)
+            ).fetchone()
+
+        response = self._fetch(url, headers, None, row)
+        if getattr(response, "from_cache", False):
+            if response.revalidated:
+                self._touch("users", "login", key)
+            return response
+        if response.status_code == 200:
+            profile = response.text
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO users (login, profile, email, etag, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, profile, response.json().get("email"), response.headers.get("ETag"), time.time()),
+                )
+                self._conn.commit()
+        return response
+
+    # Fetch one page of org members, remembering its Link rel="next" URL alongside the body
+    def get_page(self, url, headers, params=None):
+        key = f"{url}?{urlencode(params)}" if params else url
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT body, etag, fetched_at, next_url FROM member_pages WHERE url = ?", (key,)
+            ).fetchone()
+
+        response = self._fetch(url, headers, params, row, ttl=0)
+        if getattr(response, "from_cache", False):
+            if response.revalidated:
+                self._touch("member_pages", "url", key)
+            return response
+        if response.status_code == 200:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO member_pages (url, body, next_url, etag, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                    (key, response.text, response.links.get("next", {}).get("url"),
+                     response.headers.get("ETag"), time.time()),
+                )
+                self._conn.commit()
+        return response
+
+    # Serve rows younger than `ttl` (default: the cache TTL) locally, revalidate older rows with their ETag,
+    # otherwise do a full GET
+    def _fetch(self, url, headers, params, row, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if row and time.time() - row[2] < ttl:
+            METRICS.count("cache_hits")
+            return CachedResponse(row[0], row[3])
+
+        request_headers = dict(headers)
+        if row and row[1]:
+            request_headers["If-None-Match"] = row[1]
+        response = self._get(url, headers=request_headers, params=params)
+        if response.status_code == 304 and row:
+            METRICS.count("cache_revalidated")
+            return CachedResponse(row[0], row[3], revalidated=True)
+        METRICS.count("cache_misses")
+        return response
+
+    def _touch(self, table, column, key):
+        with self._lock:
+            self._conn.execute(f"UPDATE {table} SET fetched_at = ? WHERE {column} = ?", (time.time(), key))
+            self._conn.commit()
+
+    def close(self):
+        counters = METRICS.counters
+        logging.info(f"User cache: {counters.get('cache_hits', 0)} hits, "
+                     f"{counters.get('cache_revalidated', 0)} revalidated, {counters.get('cache_misses', 0)} fetched")
+        self._conn.close()
+
+# Open the cache when USER_CACHE_PATH is configured, otherwise return None (no caching)
+def open_user_cache(path, ttl=None, token=None):
+    if not path:
+        return None
+    try:
+        ttl = float(ttl) if ttl else DEFAULT_CACHE_TTL
+    except ValueError:
+        ttl = DEFAULT_CACHE_TTL
+    return UserCache(path, ttl, get_client(token).get)
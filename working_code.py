@@ -2,6 +2,14 @@ import pandas as pd
 import os
 import csv
 from dotenv import load_dotenv
+from csv_stream import iter_chunks, iter_csv_rows, write_csv_atomically
+from checkpoint import open_journal
+from emu_cache import EMU_COLUMNS, load_emu_columns
+from emu_directory import is_emu_directory, load_emu_directory
+from run_metrics import METRICS
+from row_log import open_row_log
+from login_match import join_mapping_chunks, resolve_user_mappings
+from fuzzy_match import open_fuzzy_matcher
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,6 +19,14 @@ GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 EMU_USERS_FILE = os.getenv("EMU_USERS_FILE")
 USER_MAPPINGS_FILE = os.getenv("USER_MAPPINGS_FILE")
 ORG_NAME = os.getenv("ORG_NAME")
+MAPPING_MODE = os.getenv("MAPPING_MODE", "loop")  # "join" matches all rows in one vectorized pass
+CSV_STREAMING = os.getenv("CSV_STREAMING", "").lower() in ("1", "true", "yes")  # Row-by-row, constant memory
+JOIN_CHUNK_SIZE = 50000  # Rows per vectorized join in streaming mode
+PROGRESS_JOURNAL = os.getenv("PROGRESS_JOURNAL")  # Append-only journal that lets a rerun resume
+EMU_CACHE_DIR = os.getenv("EMU_CACHE_DIR")  # Columnar EMU snapshots keyed by workbook hash
+FORCE_RESOLVE = os.getenv("FORCE_RESOLVE", "").lower() in ("1", "true", "yes")  # Re-resolve rows that have a target-user
+QUIET_MODE = os.getenv("QUIET_MODE", "").lower() in ("1", "true", "yes")  # Progress counters instead of per-row output
+FUZZY_MATCH = os.getenv("FUZZY_MATCH", "").lower() in ("1", "true", "yes")  # Fall back to fuzzy login/name matching
 
 # Extract base organization name (i.e., 'mgmri') for target-user formatting
 ORG_SUFFIX = ORG_NAME.split('-')[0]  # This will get 'mgmri' from 'mgmri-dge'
@@ -18,52 +34,54 @@ ORG_SUFFIX = ORG_NAME.split('-')[0]  # This will get 'mgmri' from 'mgmri-dge'
 # Function to read the Excel file
 def read_excel_file(file_path):
     print("Reading the Excel file")
-    return pd.read_excel(file_path)
+    with METRICS.stage("excel_load"):
+        if is_emu_directory(file_path):
+            emu_users_df = pd.DataFrame(load_emu_directory(file_path, EMU_CACHE_DIR))
+        elif EMU_CACHE_DIR:
+            emu_users_df = pd.DataFrame(load_emu_columns(file_path, EMU_CACHE_DIR))
+        else:
+            emu_users_df = pd.read_excel(file_path, usecols=lambda column: column in EMU_COLUMNS)
+    METRICS.add_rows("excel_load", len(emu_users_df))
+    return emu_users_df
 
 # Function to read the user mappings CSV file
 def read_csv_file(file_path):
     print("Reading the CSV file")
-    with open(file_path, mode='r', newline='', encoding='utf-8') as file:
-        return list(csv.DictReader(file))
+    with METRICS.stage("csv_read"), open(file_path, mode='r', newline='', encoding='utf-8') as file:
+        mappings = list(csv.DictReader(file))
+    METRICS.add_rows("csv_read", len(mappings))
+    return mappings
 
 # Function to update target-user column in the CSV file
 def update_csv_file(file_path, mappings):
     print("Writing updates back to the CSV file")
-    with open(file_path, mode='w', newline='', encoding='utf-8') as file:
-        fieldnames = ["mannequin-user", "mannequin-id", "target-user"]
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(mappings)
+    # Write to a temp file and rename it over the original so a crash never leaves a half-written CSV
+    write_csv_atomically(file_path, mappings, ["mannequin-user", "mannequin-id", "target-user"])
     print("CSV file updated successfully")
 
 # Function to process user mappings
-def process_user_mappings(user_mappings_file, emu_users_df, org_name):
+def process_user_mappings(user_mappings_file, emu_users_df, org_suffix, journal=None, row_log=None, fuzzy=None):
     print("Processing user mappings")
-    
-    mappings = read_csv_file(user_mappings_file)
-    
-    for mapping in mappings:
-        mannequin_user = mapping.get("mannequin-user")
-        if not mannequin_user:
-            print(f"Skipping row due to missing 'mannequin-user': {mapping}")
-            continue
-        
-        # Find the user in the Excel sheet (matching mannequin-user with login or name)
-        matched_user = emu_users_df[emu_users_df['login'] == mannequin_user]
-        if matched_user.empty:
-            print(f"No match found for mannequin-user: {mannequin_user}")
-            continue
 
-        # Assuming email-like data is in the 'saml_name_id' field
-        email = matched_user.iloc[0]["saml_name_id"]
+    # In streaming mode rows are read, resolved and written one at a time
+    if CSV_STREAMING:
+        mappings = resolve_user_mappings(iter_csv_rows(user_mappings_file), emu_users_df, org_suffix, journal, row_log, fuzzy, FORCE_RESOLVE)
+    else:
+        mappings = list(resolve_user_mappings(read_csv_file(user_mappings_file), emu_users_df, org_suffix, journal, row_log, fuzzy, FORCE_RESOLVE))
+
+    # Update the CSV file with the new target-user values
+    update_csv_file(user_mappings_file, mappings)
 
-        # Extract the empirical part before the '@' and append '_mgmri'
-        empirical_part = email.split('@')[0]
-        target_user = f"{empirical_part}_{ORG_SUFFIX}"
+# Function to process user mappings with one vectorized join against the EMU sheet
+def process_user_mappings_join(user_mappings_file, emu_users_df, org_suffix, journal=None, row_log=None, fuzzy=None):
+    print("Processing user mappings (join mode)")
 
-        # Update the target-user column in the mapping
-        mapping["target-user"] = target_user
-        print(f"Updated target-user for {mannequin_user} to {target_user}")
+    # In streaming mode the join runs over fixed-size chunks so memory stays flat
+    if CSV_STREAMING:
+        chunks = iter_chunks(iter_csv_rows(user_mappings_file), JOIN_CHUNK_SIZE)
+    else:
+        chunks = [read_csv_file(user_mappings_file)]
+    mappings = join_mapping_chunks(chunks, emu_users_df, org_suffix, journal, row_log, fuzzy, FORCE_RESOLVE)
 
     # Update the CSV file with the new target-user values
     update_csv_file(user_mappings_file, mappings)
@@ -81,7 +99,23 @@ def main():
         raise ValueError(f"Excel file must contain the following columns: {required_columns}")
     
     # Process user mappings and update the CSV file
-    process_user_mappings(USER_MAPPINGS_FILE, emu_users_df, ORG_SUFFIX)
+    journal = open_journal(PROGRESS_JOURNAL)
+    row_log = open_row_log(USER_MAPPINGS_FILE, QUIET_MODE, printer=print)
+    fuzzy = None
+    if FUZZY_MATCH:
+        fuzzy = open_fuzzy_matcher(emu_users_df[["login", "name", "saml_name_id"]].to_dict("records"), USER_MAPPINGS_FILE, require_email=True)
+    try:
+        if MAPPING_MODE == "join":
+            process_user_mappings_join(USER_MAPPINGS_FILE, emu_users_df, ORG_SUFFIX, journal, row_log, fuzzy)
+        else:
+            process_user_mappings(USER_MAPPINGS_FILE, emu_users_df, ORG_SUFFIX, journal, row_log, fuzzy)
+    finally:
+        row_log.close()
+        if fuzzy is not None:
+            fuzzy.close()
+        if journal is not None:
+            journal.close()
+        METRICS.write_report()
 
 if __name__ == "__main__":
     main()